@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 from src.main import Program
+import argparse
 
 if __name__ == '__main__':
-    program = Program()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=None, help='用于计算与用于计算属性收益的常驻子进程各自的数量, 默认与 CPU 核心数相同')
+    args = parser.parse_args()
+    program = Program(workers=args.workers)
     program.main()
@@ -21,6 +21,12 @@ class Character():
         self.cooldown = CoolDown()
         self.is_in_fight = False
 
+    def reset(self):
+        '''
+            重置角色的所有状态 (属性, buff, 技能, 秘籍, 触发事件, CD 等). 角色是模块级的单例 (被脚本直接导入), 因此只能原地重置, 而不能重新实例化.
+        '''
+        self.__init__()
+
     def load_character(self, data: dict):
         '''
             导入角色数据.
@@ -1,9 +1,28 @@
 # -*- coding: utf-8 -*-
+import copy
 import json
 from typing import Any
 from src.frame.global_param import GlobalParam
 
 
+def trunc(value):
+    '''
+        向零取整, 与 int() 相同. 区别在于同时支持 numpy 数组: 计算属性收益时, 属性可能是以各组属性为元素的数组 (见 src.worker_attrbenefit.subattr).
+    '''
+    try:
+        return int(value)
+    except TypeError:
+        return value.astype('int64')
+
+
+def cap(value, upper):
+    '''取 value 与 upper 中的较小值, 与 min() 相同. 区别在于同时支持 numpy 数组.'''
+    try:
+        return min(value, upper)
+    except ValueError:
+        return value.clip(None, upper)
+
+
 class Attribute():
     '''
         Attribute 类中有一些以固定字符串开头的特殊属性. 以下对这些特殊属性进行说明.
@@ -15,6 +34,7 @@ class Attribute():
             这几类属性的特点是在调用时需要实时计算, 并返回一个值 (我们希望在使用它们时, 逻辑与正常调用一个类实例的属性相同).
             这些属性的 setattr 方法应当传入一个 callable 对象 (通常是一个函数) 作为值, 并且这个 callable 对象应当需要一个参数并返回一个值. 进行 setattr 时, 这个 callable 对象会被存为当前实例对象 (即 self) 的方法, 名字为 f'method_{name}'.
             进行 getattr 操作会调用在 setattr 中传入的 callable 对象, 参数为当前实例对象 (即 self), 并将其返回的值进行返回. 如果这一属性并未进行过 setattr 操作, 那么会返回 0 (无论这一属性是否存在于类实例中).
+            计算结果会被缓存, 直到计算过程中读取过的任意属性 (包括其他实例的属性, 例如目标的防御依赖伤害来源的无视防御) 被 setattr 时才会失效. 因此 callable 对象不应依赖 Attribute 以外的可变状态.
             值得注意的是, setattr 并不拒绝传入 0 作为值 (尽管 0 并不是一个 callable 对象), 以方便对属性的初始化 (以使 IDE 进行补全提示).
 
             for example:
@@ -37,26 +57,29 @@ class Attribute():
             进行 'import_stat_change' 时, 如果有差值属性存在, 那么会基于 recoed 属性进行计算并赋给 base 属性.
     '''
 
-    # 在 __getattribute__ 方法和 __setattr__ 方法的内部, 如果使用 getattr() 和 setattr(), 一定要注意可能产生无穷递归的问题.
+    # 在 __getattr__ 方法和 __setattr__ 方法的内部, 如果使用 getattr() 和 setattr(), 一定要注意可能产生无穷递归的问题.
     # 为了降低代码出错的可能性, 建议每次直接使用 getattr 和 setattr (而不是使用 super().__getattribute__ 和 super().__setattr__) 时, 都在其后进行备注.
+    # 'at' 开头的属性均为 __slots__ 中声明的属性 (见类末尾), 读取时不经过 __getattr__. 'calc' 与 'kungfu' 属性的缓存存放在 __dict__ 中, 缓存命中时同样不经过 __getattr__.
+
+    bool_record = False
 
-    def __getattribute__(self, __name: str) -> Any:
+    def __getattr__(self, __name: str) -> Any:  # 仅在常规方式找不到属性时调用
         if __name.startswith('kungfu') or __name.startswith('calc'):
-            try:
-                method = super().__getattribute__(f'method_{__name}')
-                return method(self)
-            except:
+            method = self.__dict__.get(f'method_{__name}')
+            if method is None:
                 return 0
-        elif __name.startswith('record_'):
             try:
-                return super().__getattribute__(__name)
+                value = method(AttributeTracer(self, self, __name))
             except:
                 return 0
+            self.__dict__[__name] = value  # 缓存计算结果, 见 self.invalidate
+            return value
+        elif __name.startswith('record_'):
+            return 0
         elif __name.startswith('diff_'):
-            diff = super().__getattribute__(__name[5:]) - getattr(self, f'record_{__name[5:]}')  # 小心! 这里直接使用了 getattr().
+            diff = getattr(self, __name[5:]) - getattr(self, f'record_{__name[5:]}')  # 小心! 这里直接使用了 getattr().
             return diff
-        else:
-            return super().__getattribute__(__name)
+        raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{__name}'")
 
     def __setattr__(self, __name: str, __value: Any) -> None:
         if __name.startswith('kungfu') or __name.startswith('calc'):
@@ -65,15 +88,46 @@ class Attribute():
             if not callable(__value):
                 raise RuntimeError('"kungfu" or "calc" attr must be callable.')
             super().__setattr__(f'method_{__name}', __value)
-        elif __name.startswith('diff_'):
-            __value += getattr(self, f'record_{__name[5:]}')  # 小心! 这里直接使用了 getattr().
-            super().__setattr__(__name[5:], __value)
-        else:  # 详细逻辑请查看 self.bool_record 的注解
-            if hasattr(self, 'bool_record') and self.bool_record and __name in self.__class__.base_list:
+            self.__dict__.pop(__name, None)
+        else:
+            if __name.startswith('diff_'):
+                __name = __name[5:]
+                __value = __value + getattr(self, f'record_{__name}')  # 小心! 这里直接使用了 getattr(). 不使用 +=, 以免修改传入的 numpy 数组.
+            elif self.bool_record and __name in self.__class__.base_set:  # 详细逻辑请查看 self.bool_record 的注解
                 super().__setattr__(f'record_{__name}', __value)
             super().__setattr__(__name, __value)
+            if __name in self.__class__.export_set:
+                self.dirty[__name] = None  # 见 self.export_stat_change
+        if __name in self.calc_dependents:
+            self.invalidate(__name)
+
+    def invalidate(self, name: str):
+        '''属性 name 发生变化, 清除依赖它的 'calc' 与 'kungfu' 属性的缓存 (可能位于其他实例中), 并逐级向上清除.'''
+        dependents = self.calc_dependents.pop(name, None)  # 依赖关系会在重新计算时重新记录
+        if dependents is None:
+            return
+        for owner, calc_name in dependents:
+            if calc_name in owner.__dict__:
+                del owner.__dict__[calc_name]
+                owner.invalidate(calc_name)
+
+    def __deepcopy__(self, memo):
+        '''
+            复制实例, 用于保存模拟状态 (见 src.frame.context.SimulationContext.snapshot).
+            直接复制 __dict__ 与 __slots__ 中的属性而不经过 __setattr__, 以免清除 'calc' 与 'kungfu' 属性的缓存. 缓存的依赖关系中的其他实例 (如 DamageSource) 在同一 memo 中复制.
+        '''
+        ret = object.__new__(self.__class__)
+        memo[id(self)] = ret
+        object.__setattr__(ret, '__dict__', copy.deepcopy(self.__dict__, memo))
+        for name in Attribute.__slots__[1:]:
+            value = getattr(self, name, None)
+            if value is not None:
+                object.__setattr__(ret, name, copy.deepcopy(value, memo))
+        return ret
 
     def __init__(self) -> None:
+        super().__setattr__('calc_dependents', {})  # 属性名 -> 依赖该属性的 (实例, 'calc' 或 'kungfu' 属性名) 的集合
+        super().__setattr__('dirty', {})  # 自上次 export_stat_change 以来被 setattr 过的 add_list 与 base_list 中的属性名. 以字典代替集合, 以保持设置顺序.
         self.level = 120
         self.is_npc = True
 
@@ -292,13 +346,14 @@ class Attribute():
                 # 基础攻击 = 对应属性的基础攻击. 如果是内功, 那么还需要再加上内功基础攻击.
                 # 基础攻击提升1024分数 = 对应属性的基础攻击提升1024分数. 如果是内功, 那么还需要再加上内功基础攻击提升1024分数.
                 # 额外攻击是指来自心法转换的额外攻击.
+                # 注意, 属性可能是 numpy 数组 (见 src.worker_attrbenefit.subattr.SubAttr.load_attr_benefit), 不能使用 +=, 否则会修改属性本身.
                 AttackPowerBase = getattr(self, f'at{name}AttackPowerBase')
                 if 'Solar' == name or 'Lunar' == name or 'Neutral' == name or 'Poison' == name:
-                    AttackPowerBase += self.atMagicAttackPowerBase
+                    AttackPowerBase = AttackPowerBase + self.atMagicAttackPowerBase
                 AttackPowerPercent = getattr(self, f'at{name}AttackPowerPercent')
                 if 'Solar' == name or 'Lunar' == name or 'Neutral' == name or 'Poison' == name:
-                    AttackPowerPercent += self.atMagicAttackPowerPercent
-                return AttackPowerBase + int(AttackPowerBase * AttackPowerPercent / 1024) + getattr(self, f'kungfu{name}AttackPowerAdd')
+                    AttackPowerPercent = AttackPowerPercent + self.atMagicAttackPowerPercent
+                return AttackPowerBase + trunc(AttackPowerBase * AttackPowerPercent / 1024) + getattr(self, f'kungfu{name}AttackPowerAdd')
             return func
         self.calcPhysicsAttackPower = calc_AttackPower('Physics')
         self.calcSolarAttackPower = calc_AttackPower('Solar')
@@ -326,7 +381,7 @@ class Attribute():
                 CriticalStrikeBase = getattr(self, f'at{name}CriticalStrike') + self.atAllTypeCriticalStrike
                 if 'Solar' == name or 'Lunar' == name or 'Neutral' == name or 'Poison' == name:
                     CriticalStrikeBase += self.atMagicCriticalStrike
-                return int((CriticalStrikeBase + getattr(self, f'kungfu{name}CriticalStrikeAdd')) / GlobalParam.CriticalStrikeCof(self.level) * 10000) + getattr(self, f'at{name}CriticalStrikeBaseRate')
+                return trunc((CriticalStrikeBase + getattr(self, f'kungfu{name}CriticalStrikeAdd')) / GlobalParam.CriticalStrikeCof(self.level) * 10000) + getattr(self, f'at{name}CriticalStrikeBaseRate')
             return func
         self.calcPhysicsCriticalStrike = calc_CriticalStrike('Physics')
         self.calcSolarCriticalStrike = calc_CriticalStrike('Solar')
@@ -353,13 +408,13 @@ class Attribute():
                 # 注意, 计算得到的最终会心效果是一个1024分数, 且最大为 1280 (对应 300% 会心效果), 这符合游戏内的实际原理.
                 CriticalDamagePowerBase = self.atAllTypeCriticalDamagePowerBase
                 if 'Physics' == name:
-                    CriticalDamagePowerBase += self.atPhysicsCriticalDamagePowerBase
+                    CriticalDamagePowerBase = CriticalDamagePowerBase + self.atPhysicsCriticalDamagePowerBase
                 elif 'Solar' == name or 'Lunar' == name or 'Neutral' == name or 'Poison' == name:
-                    CriticalDamagePowerBase += self.atMagicCriticalDamagePowerBase
+                    CriticalDamagePowerBase = CriticalDamagePowerBase + self.atMagicCriticalDamagePowerBase
                 CriticalDamagePowerBaseKiloNumRate = getattr(self, f'at{name}CriticalDamagePowerBaseKiloNumRate')
                 if 'Solar' == name or 'Lunar' == name or 'Neutral' == name or 'Poison' == name:
-                    CriticalDamagePowerBaseKiloNumRate += self.atMagicCriticalDamagePowerBaseKiloNumRate
-                return min(int(CriticalDamagePowerBase * 1024 / GlobalParam.CriticalDamagePowerCof(self.level)) + CriticalDamagePowerBaseKiloNumRate, 1280)
+                    CriticalDamagePowerBaseKiloNumRate = CriticalDamagePowerBaseKiloNumRate + self.atMagicCriticalDamagePowerBaseKiloNumRate
+                return cap(trunc(CriticalDamagePowerBase * 1024 / GlobalParam.CriticalDamagePowerCof(self.level)) + CriticalDamagePowerBaseKiloNumRate, 1280)
             return func
         self.calcPhysicsCriticalDamagePower = calc_CriticalDamagePower('Physics')
         self.calcSolarCriticalDamagePower = calc_CriticalDamagePower('Solar')
@@ -386,8 +441,8 @@ class Attribute():
                 # 注意, 计算得到的最终破防是一个 1024 分数, 这符合游戏内的实际原理.
                 OvercomeBase = getattr(self, f'at{name}OvercomeBase')
                 if 'Solar' == name or 'Lunar' == name or 'Neutral' == name or 'Poison' == name:
-                    OvercomeBase += self.atMagicOvercome
-                return int((OvercomeBase + int(OvercomeBase * getattr(self, f'at{name}OvercomePercent') / 1024) + getattr(self, f'kungfu{name}OvercomeAdd')) * 1024 / GlobalParam.OvercomeCof(self.level))
+                    OvercomeBase = OvercomeBase + self.atMagicOvercome
+                return trunc((OvercomeBase + trunc(OvercomeBase * getattr(self, f'at{name}OvercomePercent') / 1024) + getattr(self, f'kungfu{name}OvercomeAdd')) * 1024 / GlobalParam.OvercomeCof(self.level))
             return func
         self.calcPhysicsOvercome = calc_Overcome('Physics')
         self.calcSolarOvercome = calc_Overcome('Solar')
@@ -422,11 +477,11 @@ class Attribute():
                 ShieldBase = getattr(self, f'at{realname}ShieldBase')
                 ShieldAdditional = 0
                 if 'Solar' == name or 'Lunar' == name or 'Neutral' == name or 'Poison' == name:
-                    ShieldBase += self.atMagicShield
+                    ShieldBase = ShieldBase + self.atMagicShield
                 if 'Physics' == name:
                     ShieldAdditional = self.atPhysicsShieldAdditional
-                Shield = int(int(ShieldBase + ShieldBase * getattr(self, f'at{realname}ShieldPercent') + ShieldAdditional) * (1024 - (0 if self.DamageSource is None else self.DamageSource.atAllShieldIgnorePercent)) / 1024)
-                return min(int(Shield * 1024 / (Shield + (GlobalParam.PhysicsShieldCof(self.level) if 'Physics' == name else GlobalParam.MagicShieldCof(self.level)))), 768)
+                Shield = trunc(trunc(ShieldBase + ShieldBase * getattr(self, f'at{realname}ShieldPercent') + ShieldAdditional) * (1024 - (0 if self.DamageSource is None else self.DamageSource.atAllShieldIgnorePercent)) / 1024)
+                return cap(trunc(Shield * 1024 / (Shield + (GlobalParam.PhysicsShieldCof(self.level) if 'Physics' == name else GlobalParam.MagicShieldCof(self.level)))), 768)
             return func
         self.calcPhysicsShield = calc_Shield('Physics')
         self.calcSolarShield = calc_Shield('Solar')
@@ -440,7 +495,7 @@ class Attribute():
         def calc_Strain(self: Attribute):
             # 最终无双的计算公式是: int((基础无双等级 + int(基础无双等级 * 基础无双等级提升1024分数 / 1024)) * 1024 / 无双系数 + 额外无双1024分数).
             # 注意, 计算得到的最终无双是一个 1024 分数, 这符合游戏内的实际原理.
-            return int((self.atStrainBase + int(self.atStrainBase * self.atStrainPercent / 1024)) * 1024 / GlobalParam.StrainCof(self.level) + self.atStrainRate)
+            return trunc((self.atStrainBase + trunc(self.atStrainBase * self.atStrainPercent / 1024)) * 1024 / GlobalParam.StrainCof(self.level) + self.atStrainRate)
         self.calcStrain = calc_Strain
 
         # self.calcHaste = 0
@@ -448,7 +503,7 @@ class Attribute():
 
         def calc_Haste(self: Attribute):
             # 最终加速的计算公式是: min(int(基础加速等级 * 1024 / 加速系数) + 额外加速1024分数, 256) + 突破上限加速1024分数
-            return min(int(self.atHasteBase * 1024 / GlobalParam.HasteCof(self.level)) + self.atHasteBasePercentAdd, 256) + self.atUnlimitHasteBasePercentAdd
+            return cap(trunc(self.atHasteBase * 1024 / GlobalParam.HasteCof(self.level)) + self.atHasteBasePercentAdd, 256) + self.atUnlimitHasteBasePercentAdd
         self.calcHaste = calc_Haste
 
         # self.calcPhysicsDamageAddPercent = 0  # 外功最终伤害和治疗效果提升1024分数
@@ -468,7 +523,7 @@ class Attribute():
                 # 注意, 计算得到的最终伤害和治疗效果提升是一个 1024 分数, 这符合游戏内的实际原理.
                 DamageAddPercentBase = self.atAllDamageAddPercent
                 if 'Solar' == name or 'Lunar' == name or 'Neutral' == name or 'Poison' == name:
-                    DamageAddPercentBase += self.atAllMagicDamageAddPercent
+                    DamageAddPercentBase = DamageAddPercentBase + self.atAllMagicDamageAddPercent
                 return DamageAddPercentBase
             return func
         self.calcPhysicsDamageAddPercent = calc_DamageAddPercent('Physics')
@@ -819,18 +874,30 @@ class Attribute():
         # 'atDstNpcDamageCoefficient',  # 非侠士伤害
     ]
 
+    __slots__ = ('__dict__', 'level', 'is_npc', *add_list, *base_list)
+    base_set = frozenset(base_list)
+    export_set = frozenset(add_list) | base_set  # 导出模型时需要记录的属性
+
     def export_stat_change(self):
+        '''
+            导出自上次导出以来发生变化的属性. add_list 中的属性导出其值, base_list 中的属性导出其与 record 属性的差值 (即 'diff_' 属性).
+            只检查自上次导出以来被 setattr 过的属性 (见 self.dirty), 因此代价与变化的属性数成正比, 而非与属性总数成正比.
+        '''
         ret = {}
-        for name in self.__class__.add_list:
+        dirty = self.dirty
+        if len(dirty) == 0:
+            return ret
+        last_stat = self.last_stat
+        base_set = self.__class__.base_set
+        for name in dirty:
             value = getattr(self, name)
-            if name not in self.last_stat or value != self.last_stat[name]:
-                self.last_stat[name] = value
-                ret[name] = value
-        for name in self.__class__.base_list:
-            value = getattr(self, name)
-            if name not in self.last_stat or value != self.last_stat[name]:
-                self.last_stat[name] = value
-                ret[f'diff_{name}'] = getattr(self, f'diff_{name}')  # 语法糖, 实际上 self 并没有名为 f'diff_{name}' 的属性, 具体实现见 self.__getattribute__ 方法
+            if name not in last_stat or value != last_stat[name]:
+                last_stat[name] = value
+                if name in base_set:
+                    ret[f'diff_{name}'] = value - getattr(self, f'record_{name}')  # 即 f'diff_{name}', 具体实现见 self.__getattr__ 方法
+                else:
+                    ret[name] = value
+        dirty.clear()
         return ret
 
     def import_stat_change(self, data):
@@ -854,3 +921,27 @@ class Attribute():
             self.atPoisonAttackPowerBase += 538
 
         self.bool_record = False
+
+
+class AttributeTracer():
+    '''
+        计算 'calc' 与 'kungfu' 属性时, 代替实例对象 (即 self) 传入计算函数. 读取属性时与实例对象相同, 同时会记录读取了哪些属性, 以便在这些属性变化时清除缓存.
+        读取到的属性若是另一个 Attribute 实例 (例如 DamageSource), 则同样以 AttributeTracer 包装返回.
+    '''
+    __slots__ = ('target', 'owner', 'name')
+
+    def __init__(self, target: Attribute, owner: Attribute, name: str) -> None:
+        self.target = target  # 被读取属性的实例
+        self.owner = owner  # 缓存所在的实例
+        self.name = name  # 正在计算的属性名
+
+    def __getattr__(self, __name: str) -> Any:
+        target = self.target
+        value = getattr(target, __name)
+        dependents = target.calc_dependents.get(__name)
+        if dependents is None:
+            dependents = target.calc_dependents[__name] = set()
+        dependents.add((self.owner, self.name))
+        if isinstance(value, Attribute):
+            return AttributeTracer(value, self.owner, self.name)
+        return value
@@ -1,155 +1,150 @@
 # -*- coding: utf-8 -*-
+from src.frame.buffeffect import BuffEffect
 from src.frame.event import Event
 from src.frame.fetchdata import TabAttr
 
 
+class BuffRecord():
+    '''
+        BuffRecord 类为一个 buff 的记录, 由 Buff.init_add 创建.
+    '''
+    __slots__ = ('buff_attr', 'ID', 'Level', 'buff_interval', 'buff_count', 'buff_stacknum', 'buff_event', 'buff_tick', 'active_list', 'end_time_list', 'damage_source', 'call_dot', 'effect')
+
+    def __init__(self, buff_attr, ID, Level, buff_interval, buff_count, buff_stacknum) -> None:
+        self.buff_attr = buff_attr
+        self.ID = ID
+        self.Level = Level
+        self.buff_interval = buff_interval
+        self.buff_count = buff_count
+        self.buff_stacknum = buff_stacknum
+        self.buff_event = None  # 事件句柄
+        self.buff_tick = None  # 下一次 Active 事件的 tick
+        self.active_list = []  # Active 时执行的函数, 元素为 (func, args, kwargs)
+        self.end_time_list = []  # 移除时执行的函数, 元素为 (func, args, kwargs)
+        self.damage_source = None  # DOT 的原始伤害
+        self.call_dot = None  # DOT 的伤害函数
+        self.effect = BuffEffect.get(ID, Level, buff_attr)  # 编译后的 buff 效果
+
+
 class Buff():
     '''
         Buff 类用于存放某个对象的 buff 并实现相关功能, 可以通俗地理解为 buff 列表.
     '''
-    tabattr = TabAttr('settings/skill/buff.tab')
+    tabattr = TabAttr('settings/skill/buff.tab', keys=[('ID', 'Level')])
+    # 这里肯定有 bug, 为了避免 bug, 这里做一个白名单
+    stack_whitelist = {(12850, 2), (25716, 1), (25716, 2)}
 
     def __init__(self) -> None:
         self.atHaste = 0
-        self.table = {}  # 初始化哈希表, 用于存放当前对象的所有 buff
-
-    def init_add(self, ID, Level, stacknum):
-        # 获取 buff 属性
-        buff_attr = self.__class__.tabattr.fetch(['ID', 'Level'], [ID, Level])
-        buff_interval = buff_attr['Interval']
-        buff_count = buff_attr['Count']
-        key = f'{ID}_{Level}'
-        if key not in self.table:  # 如果当前没有该 buff
-            buff_dict = {
-                'buff_attr': buff_attr,
-                'ID': ID,
-                'Level': Level,
-                'buff_interval': buff_interval,
-                'buff_count': buff_count,
-                'buff_stacknum': stacknum,
-            }
-        else:
-            buff_dict = self.table[key]
-        return buff_dict
-
-    def add(self, buff_dict, time_tick):
-        buff_attr = buff_dict['buff_attr']
-        ID = buff_dict['ID']
-        Level = buff_dict['Level']
-        buff_interval = buff_dict['buff_interval']
-        buff_count = buff_dict['buff_count']
-        key = f'{ID}_{Level}'
+        self.table = {}  # 初始化哈希表, 用于存放当前对象的所有 buff. 以 (ID, Level) 为键.
+        self.levels = {}  # ID -> {Level: BuffRecord}, 即某个 ID 的所有 buff. 以字典代替集合, 以保持添加顺序.
+
+    def init_add(self, ID, Level, stacknum) -> BuffRecord:
+        buff_record = self.table.get((ID, Level))
+        if buff_record is None:  # 如果当前没有该 buff
+            # 获取 buff 属性
+            buff_attr = self.__class__.tabattr.fetch(['ID', 'Level'], [ID, Level])
+            buff_record = BuffRecord(buff_attr, ID, Level, buff_attr['Interval'], buff_attr['Count'], stacknum)
+        return buff_record
+
+    def add(self, buff_record: BuffRecord, time_tick):
+        buff_attr = buff_record.buff_attr
+        ID = buff_record.ID
+        Level = buff_record.Level
+        key = (ID, Level)
         if time_tick is None:
-            timeset = int(buff_interval * 1024 / 16)
+            timeset = int(buff_record.buff_interval * 1024 / 16)
         else:
             timeset = int(time_tick)
 
         if key not in self.table:  # 如果当前没有该 buff
-            self.table[key] = buff_dict  # 将 buff 添加至哈希表
+            self.table[key] = buff_record  # 将 buff 添加至哈希表
+            self.levels.setdefault(ID, {})[Level] = buff_record
             if timeset > 0:
-                buff_tick = Event.add(timeset, self.active, ID, Level)
-                self.table[key]['buff_tick'] = buff_tick  # 将 buff_tick 添加至哈希表
+                buff_record.buff_event = Event.add(timeset, self.active, ID, Level)
+                buff_record.buff_tick = buff_record.buff_event.tick
         else:  # 如果当前已有该 buff
             if not 'Damage' == buff_attr['FunctionType'] and not 'Hot' == buff_attr['FunctionType']:  # 如果 buff 类型不是 DOT 和 HOT
                 self.delete(ID, Level, pop_table=False, all=True)  # 移除 buff, 但不移出哈希表, 仅移出事件列表
                 if timeset > 0:
-                    buff_tick = Event.add(timeset, self.active, ID, Level)  # 再次添加至事件列表
-                    self.table[key]['buff_tick'] = buff_tick  # 将 buff_tick 添加至哈希表
+                    buff_record.buff_event = Event.add(timeset, self.active, ID, Level)  # 再次添加至事件列表
+                    buff_record.buff_tick = buff_record.buff_event.tick
             else:  # 是 DOT 或 HOT, 则刷新跳数
-                self.table[key]['buff_count'] = buff_attr['Count']
+                buff_record.buff_count = buff_attr['Count']
             if 1 == buff_attr['IsStackable']:  # 如果 buff 允许叠层
-                self.table[key]['buff_stacknum'] = min(buff_attr['MaxStackNum'], self.table[key]['buff_stacknum'] + 1)
+                buff_record.buff_stacknum = min(buff_attr['MaxStackNum'], buff_record.buff_stacknum + 1)
             self.delete(ID, Level, False, False, True)  # 删除 buff 属性以重新初始化
         # 实现 buff ActiveAttribute
         # 已在 character.player.Player.Addbuff() 中实现
 
-    def init_active(self, buff_dict, func, *args, **kwargs):
-        ID = buff_dict['ID']
-        Level = buff_dict['Level']
-        key = f'{ID}_{Level}'
-        if not 'atActive' in self.table[key]:
-            self.table[key]['atActive'] = []
-        self.table[key]['atActive'].append((func, args, kwargs))
+    def init_active(self, buff_record: BuffRecord, func, *args, **kwargs):
+        self.table[(buff_record.ID, buff_record.Level)].active_list.append((func, args, kwargs))
 
     def active(self, ID, Level):
         '''处理 Active 事件. 此方法由事件列表调用.'''
-        key = f'{ID}_{Level}'
+        buff_record = self.table[(ID, Level)]
 
         # 实现 buff ActiveAttribute
         # 已在 character.player.Player.Addbuff() 中实现
-        if 'atActive' in self.table[key]:
-            for i in self.table[key]['atActive']:
-                s_func, s_args, s_kwargs = i
-                s_func(*s_args, **s_kwargs)
+        for s_func, s_args, s_kwargs in buff_record.active_list:
+            s_func(*s_args, **s_kwargs)
 
-        if 1 == self.table[key]['buff_count']:
+        if 1 == buff_record.buff_count:
             self.delete(ID, Level, delete_event=False, all=True)  # 移除 buff, 由于导致 ActiveBuff 的正是事件列表的取出处理, 因此无需再移出事件列表, 仅需移出哈希表
         else:  # 计数类 buff 特殊处理
-            self.table[key]['buff_count'] -= 1
-            self.table[key]['buff_tick'] = Event.add(int(self.table[key]['buff_interval'] * 1024 / 16), self.active, ID, Level)
+            buff_record.buff_count -= 1
+            buff_record.buff_event = Event.add(int(buff_record.buff_interval * 1024 / 16), self.active, ID, Level)
+            buff_record.buff_tick = buff_record.buff_event.tick
 
-    def init_delete(self, buff_dict, func, *args, **kwargs):
-        ID = buff_dict['ID']
-        Level = buff_dict['Level']
-        key = f'{ID}_{Level}'
-        if not 'atEndTime' in self.table[key]:
-            self.table[key]['atEndTime'] = []
-        self.table[key]['atEndTime'].append((func, args, kwargs))
+    def init_delete(self, buff_record: BuffRecord, func, *args, **kwargs):
+        self.table[(buff_record.ID, buff_record.Level)].end_time_list.append((func, args, kwargs))
 
     def delete(self, ID, Level=None, delete_event=True, pop_table=True, all=False):
         '''移除 buff. 分为两个部分: 移出哈希表和移出事件列表. 两部分可以单独进行, 但如果都需要进行, 则应先移出事件列表.'''
-        def temp_delete(key, delete_event, pop_table, all):
-            if not all and self.table[key]['buff_stacknum'] > 1:
-                # 这里肯定有 bug, 为了避免 bug, 这里做一个白名单
-                whitelist = ['12850_2', '25716_1', '25716_2']
-                if key in whitelist:
-                    self.table[key]['buff_stacknum'] -= 1
+        for buff_record in self._get_record(ID, Level):
+            if not all and buff_record.buff_stacknum > 1:
+                if (buff_record.ID, buff_record.Level) in self.__class__.stack_whitelist:
+                    buff_record.buff_stacknum -= 1
                 else:
-                    raise RuntimeError('Need whitelist.', key, self.table[key]['buff_attr']['Name'])
+                    raise RuntimeError('Need whitelist.', (buff_record.ID, buff_record.Level), buff_record.buff_attr['Name'])
             else:
                 # 实现 buff EndTimeAttribute
                 # 已在 character.player.Player.Addbuff() 中实现
-                if 'atEndTime' in self.table[key]:
-                    while len(self.table[key]['atEndTime']) > 0:
-                        s_func, s_args, s_kwargs = self.table[key]['atEndTime'].pop()
-                        s_func(*s_args, **s_kwargs)
-                if 'atActive' in self.table[key]:
-                    while len(self.table[key]['atActive']) > 0:
-                        self.table[key]['atActive'].pop()
-                parts = key.split('_')
-                if delete_event and 'buff_tick' in self.table[key]:
-                    Event.delete(self.table[key]['buff_tick'], self.active, int(parts[0]), int(parts[1]))
+                end_time_list = buff_record.end_time_list
+                while len(end_time_list) > 0:
+                    s_func, s_args, s_kwargs = end_time_list.pop()
+                    s_func(*s_args, **s_kwargs)
+                buff_record.active_list.clear()
+                if delete_event and buff_record.buff_event is not None:
+                    Event.cancel(buff_record.buff_event)
                 if pop_table:
-                    self.table.pop(key)
-        key_list = self._get_key(ID, Level)
-        for key in key_list:
-            temp_delete(key, delete_event, pop_table, all)
+                    self._pop(buff_record.ID, buff_record.Level)
+
+    def _pop(self, ID, Level):
+        if self.table.pop((ID, Level), None) is not None:
+            levels = self.levels[ID]
+            levels.pop(Level)
+            if len(levels) == 0:
+                self.levels.pop(ID)
 
     def is_exist(self, ID, Level=None):
-        ret = self._get_key(ID, Level)
-        return len(ret) > 0
+        if Level is None or Level == 0:
+            return ID in self.levels
+        return (ID, Level) in self.table
 
-    def get_dict(self, ID, Level=None):
-        ret = self._get_key(ID, Level)
-        for i in range(len(ret)):
-            ret[i] = self.table[ret[i]]
-        return ret
+    def get_dict(self, ID, Level=None) -> list:
+        return self._get_record(ID, Level)
 
     def get_left_tick(self, ID, Level=None):
-        ret_key = self._get_key(ID, Level)
-        ret_left_tick = []
-        for key in ret_key:
-            ret_left_tick.append(self.table[key]['buff_tick'] - Event.tick)
+        ret_record = self._get_record(ID, Level)
+        ret_left_tick = [buff_record.buff_tick - Event.tick for buff_record in ret_record]
+        ret_key = [(buff_record.ID, buff_record.Level) for buff_record in ret_record]
         return ret_left_tick, ret_key
 
-    def _get_key(self, ID, Level):
-        ret = []
+    def _get_record(self, ID, Level) -> list:
+        '''Level 为 None 或 0 时, 返回该 ID 的所有 buff.'''
         if Level is None or Level == 0:
-            for key in self.table:
-                if f'{ID}' in key:
-                    ret.append(key)
-        if Level is not None and Level > 0:
-            key = f'{ID}_{Level}'
-            if key in self.table:
-                ret.append(key)
-        return ret
+            levels = self.levels.get(ID)
+            return list(levels.values()) if levels is not None else []
+        buff_record = self.table.get((ID, Level))
+        return [buff_record] if buff_record is not None else []
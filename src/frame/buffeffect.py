@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from src.frame.fetchdata import TabRow
+
+
+def add_attr(attr, name, value):
+    '''为属性 name 加上 value. buff 的属性效果及其移除均通过本函数实现.'''
+    setattr(attr, name, getattr(attr, name) + value)
+
+
+class BuffEffect():
+    '''
+        BuffEffect 类为编译后的 buff 效果. 同一 (ID, Level) 的 buff 只在第一次被添加时读取 buff.tab 中的各列并编译, 结果在进程内共享 (见 get).
+        BeginAttribute 被编译为 begin 列表, 元素为 (操作类型, 值A, 值B), 按表中的顺序排列 (移除时逆序执行, 见 Buff.delete).
+    '''
+    __slots__ = ('ID', 'Level', 'script_file', 'begin', 'active', 'end_time', 'interval', 'min_interval', 'max_interval', 'dot')
+
+    # begin 的操作类型
+    ATTRIB = 0  # 属性, 值A 为属性名, 值B 为数值
+    SCRIPT = 1  # 脚本, 值A 为脚本路径
+    RECIPE = 2  # 秘籍, 值A 和值B 为 RecipeID 和 RecipeLevel
+    SKILL_EVENT = 3  # 触发事件, 值A 为事件 ID
+    # active 与 end_time 的操作类型
+    CALL_DAMAGE = 4  # DOT 伤害
+    CALL_BUFF = 5  # 添加 buff, 值A 和值B 为 ID 和 Level
+
+    # 模拟中无需处理的属性
+    ignore_list = {
+        'atHalt',  # 眩晕
+        'atBeTherapyCoefficient',  # 减疗
+        'atImmunity',  # 免疫施法击退
+        'atKnockedDownRate',  # 被击倒概率
+        'atKnockedOffRate',  # 被击飞概率
+        'atImmuneSkillMove',  # 免疫僵直
+        'atAddTransparencyValue',  # 调整透明度
+        'atSetSelectableType',  # 不可被选取
+        'atStealth',  # 隐身
+        'atMoveSpeedPercent',  # 移速提高
+        'atNoLimitChangeSkillIcon',  # 更换技能图标
+    }
+    max_BeginAttribute_count = 15
+    max_ActiveAttribute_count = 2
+    max_EndTimeAttribute_count = 2
+
+    cache = {}  # (ID, Level) -> BuffEffect
+
+    @classmethod
+    def get(cls, ID, Level, buff_attr: TabRow):
+        ret = cls.cache.get((ID, Level))
+        if ret is None:
+            ret = cls.cache[(ID, Level)] = cls(ID, Level, buff_attr)
+        return ret
+
+    def __deepcopy__(self, memo):
+        return self  # 在进程内共享, 保存模拟状态时无需复制 (见 src.frame.context.SimulationContext.snapshot)
+
+    def __init__(self, ID, Level, buff_attr: TabRow) -> None:
+        self.ID = ID
+        self.Level = Level
+        # ScriptFile
+        self.script_file = str(buff_attr['ScriptFile']) if buff_attr['ScriptFile'] is not None else None
+        # BeginAttribute
+        self.begin = []
+        for i in range(self.max_BeginAttribute_count):
+            BeginAttrib = buff_attr[f'BeginAttrib{i + 1}']
+            BeginValue = buff_attr[f'BeginValue{i + 1}A']
+            BeginValue2 = buff_attr[f'BeginValue{i + 1}B']
+            if BeginAttrib is None or BeginAttrib in self.ignore_list:
+                continue
+            if 'atExecuteScript' == BeginAttrib:
+                self.begin.append((self.SCRIPT, BeginValue, None))
+            elif 'atSetTalentRecipe' == BeginAttrib:
+                self.begin.append((self.RECIPE, int(BeginValue), int(BeginValue2)))
+            elif 'atSkillEventHandler' == BeginAttrib:
+                self.begin.append((self.SKILL_EVENT, int(BeginValue), None))
+            else:
+                try:
+                    self.begin.append((self.ATTRIB, str(BeginAttrib), int(BeginValue)))
+                except:
+                    raise RuntimeError('Add buff failed.', BeginAttrib, BeginValue)
+        # ActiveAttribute
+        self.active = []
+        for i in range(self.max_ActiveAttribute_count):
+            ActiveAttrib = buff_attr[f'ActiveAttrib{i + 1}']
+            ActiveValue = buff_attr[f'ActiveValue{i + 1}A']
+            if ActiveAttrib is None:
+                continue
+            if 'atCall' in ActiveAttrib and 'Damage' in ActiveAttrib:
+                self.active.append((self.CALL_DAMAGE, None, None))
+            elif 'atExecuteScript' == ActiveAttrib:
+                self.active.append((self.SCRIPT, ActiveValue, None))
+            else:
+                raise RuntimeError('Add buff failed.', ActiveAttrib, ActiveValue)
+        # EndTimeAttribute
+        self.end_time = []
+        for i in range(self.max_EndTimeAttribute_count):
+            EndTimeAttrib = buff_attr[f'EndTimeAttrib{i + 1}']
+            EndTimeValue = buff_attr[f'EndTimeValue{i + 1}A']
+            EndTimeValue2 = buff_attr[f'EndTimeValue{i + 1}B']
+            if EndTimeAttrib is None:
+                continue
+            if 'atExecuteScript' == EndTimeAttrib:
+                self.end_time.append((self.SCRIPT, EndTimeValue, None))
+            elif 'atCallBuff' == EndTimeAttrib:
+                self.end_time.append((self.CALL_BUFF, int(EndTimeValue), int(EndTimeValue2)))
+            else:
+                raise RuntimeError('Add buff failed.', EndTimeAttrib, EndTimeValue)
+        # 作用间隔 (加速处理见 Player.AddBuff)
+        self.interval = buff_attr['Interval']
+        self.min_interval = int(buff_attr['MinInterval'])
+        self.max_interval = int(buff_attr['MaxInterval'])
+        # DOT: (kindtype, nDamageBase, channel_interval_cof), 非 DOT 为 None. 见 Player.set_dot
+        self.dot = None
+        ActiveAttrib1 = buff_attr['ActiveAttrib1']
+        if ActiveAttrib1 is not None and ActiveAttrib1.startswith('atCall') and ActiveAttrib1.endswith('Damage'):
+            sum_count = int(buff_attr['Count'])
+            sum_interval = int(buff_attr['Count']) * int(buff_attr['Interval'])
+            channel_interval_cof = 1 / sum_count * max(16, int(sum_interval / 12)) / 16
+            kindtype = ActiveAttrib1[:-6][6:]  # atCall{kindtype}Damage
+            self.dot = (kindtype, int(buff_attr['ActiveValue1A']), channel_interval_cof)
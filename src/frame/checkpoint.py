@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from pathlib import Path
+from src.frame.datapack import DataPack
+from src.frame.modelcache import ModelCache
+import hashlib
+import json
+
+
+class Checkpoint():
+    '''
+        Checkpoint 类为模拟状态的检查点 (见 src.frame.context.SimulationContext.snapshot) 的缓存. 注意, 该类不应被实例化.
+
+        宏 (即 skill_list 展开后的技能列表) 在每个 lists 块的边界处保存检查点. 修改宏后, 从技能列表的最长相同前缀对应的检查点继续模拟, 而不必从头模拟.
+        检查点的键是链式的: 第 0 个键 (基础键) 由除技能列表以外的全部输入 (以及数据与 player.json 的内容) 决定, 见 base_key. 第 i 个键由第 i - 1 个键与技能列表中的第 i 个技能决定, 见 prefix_keys.
+        因此, 技能列表前缀相同时, 前缀对应的键也相同. 检查点以模拟读取过的技能数 (而非 lists 块) 为前缀的长度, 因此修改 lists 块的内部同样可以复用检查点.
+        检查点保存在常驻的 worker_calc 进程的内存中, 最多保留 max_count 个, 按最近使用时间淘汰.
+    '''
+    VERSION = 1  # 检查点格式版本. 模拟状态的结构变化时自增.
+    max_count = 32
+    table = OrderedDict()  # 键 -> 检查点, 按最近使用时间排列 (最久未使用的在前)
+    hits = 0
+    misses = 0
+    resumed = 0  # 最近一次模拟复用的技能数
+
+    @classmethod
+    def base_key(cls, arg: dict) -> str:
+        '''计算基础键. arg 为发送给 worker_calc 的参数 (属性, 环境与战斗设置).'''
+        fight = dict(arg['fight'])
+        fight.pop('skill_list', None)
+        fight['include'] = {k: v for k, v in fight['include'].items() if 'lists' != k}
+        content = {
+            'version': cls.VERSION,
+            'attr_self': arg['attr_self'],
+            'attr_target': arg['attr_target'],
+            'env': arg['env'],
+            'fight': fight,
+            'data': ModelCache.data_version(),
+            'scripts': ModelCache.scripts_version(),
+            'player': DataPack.file_digest(Path('data/player.json')),
+        }
+        s = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def prefix_keys(base_key: str, skill_list: list) -> list:
+        '''计算技能列表各前缀的键. 返回值的第 i 个元素为前 i 个技能对应的键.'''
+        ret = [base_key]
+        for name in skill_list:
+            s = f'{ret[-1]}\n{json.dumps(name, ensure_ascii=False)}'
+            ret.append(hashlib.sha256(s.encode('utf-8')).hexdigest())
+        return ret
+
+    @classmethod
+    def put(cls, key: str, checkpoint):
+        cls.table[key] = checkpoint
+        cls.table.move_to_end(key)
+        while len(cls.table) > cls.max_count:
+            cls.table.popitem(last=False)
+
+    @classmethod
+    def find(cls, keys: list):
+        '''
+            查找最长前缀的检查点. keys 见 prefix_keys.
+            返回值为 (前缀长度, 检查点). 不存在时返回 None.
+        '''
+        for i in range(len(keys) - 1, 0, -1):
+            checkpoint = cls.table.get(keys[i])
+            if checkpoint is not None:
+                cls.table.move_to_end(keys[i])
+                cls.hits += 1
+                cls.resumed = i
+                return i, checkpoint
+        cls.misses += 1
+        cls.resumed = 0
+        return None
+
+    @classmethod
+    def stat(cls) -> dict:
+        return {
+            'hits': cls.hits,
+            'misses': cls.misses,
+            'count': len(cls.table),
+            'resumed': cls.resumed,
+        }
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from src.frame.damage import Damage
+from src.frame.event import Event
+from src.frame.skills import Skill
+import copy
+import random
+
+
+class SimulationContext():
+    '''
+        SimulationContext 类为一次模拟 (一场战斗) 的全部状态: 时间线与事件列表 (Event), 伤害日志与统计 (Damage), 通用技能表 (Skill.general_table), player 和 target, random 的状态, 以及脚本的状态 (script_state).
+
+        原有的模块级接口 (Event, Damage 的类属性, 被脚本直接导入的 player 和 target 单例, 以及 random 模块) 保持不变, 始终指向当前激活的上下文.
+        激活另一个上下文时, 会将上述类属性, 单例的实例字典 (__dict__) 与 random 的状态整体换出并换入该上下文的状态. 切换的代价是常数级的, 而模拟过程中的访问没有额外开销.
+        因此, 同一进程中可以依次 (或交替) 运行任意多场模拟, 但同一时刻只有一个上下文处于激活状态, 不应在多个线程中同时使用.
+        进程启动时的模块级状态即默认上下文 (SimulationContext.default), 不使用上下文的代码 (如 src.worker_calc) 始终在默认上下文中运行.
+
+        for example:
+        ```python
+            ctx = SimulationContext(seed=1)
+            with ctx:  # 激活 ctx, 退出时恢复之前的上下文
+                player.init_calc()
+                ...
+            with ctx:  # 再次激活时, 状态与上次退出时相同
+                print(Damage.dps)
+        ```
+        脚本模块类在进程内共享, 因此脚本不应在类属性中保存模拟状态, 而应通过 SimulationContext.current().script_state 存放.
+
+        此外, snapshot 与 restore 用于保存与恢复当前状态的检查点 (深复制), 以便从模拟的中途继续模拟, 见 src.frame.checkpoint.
+    '''
+    # 属于上下文的类属性
+    class_state = (
+        (Event, ('tick', 'heap', 'count', 'seq')),
+        (Damage, ('damage_list', 'model_list', 'sum_damage', 'skill_stat', '_dps', 'variant_sum_damage', 'stream')),
+        (Skill, ('general_table',)),
+    )
+    transient = {(Damage, 'stream')}  # 不属于检查点的类属性 (与主进程的通信), 恢复检查点时保持不变
+    default = None  # 默认上下文, 即进程启动时的模块级状态. 见模块末尾
+    active = None  # 当前激活的上下文
+
+    def __init__(self, seed=None) -> None:
+        '''
+            - `seed` : 第一次激活时 random 的种子. 为 None 时由系统随机选取.
+        '''
+        self.seed = seed
+        self.state = None  # 未激活时保存的状态. 为 None 表示尚未初始化 (第一次激活时重置为初始状态).
+        self.script_state = {}  # 脚本的模拟状态, 键由脚本自行决定
+        self.previous = []  # 进入 with 语句前激活的上下文
+
+    @classmethod
+    def current(cls):
+        '''获取当前激活的上下文.'''
+        return cls.active
+
+    def activate(self):
+        '''激活本上下文. 当前激活的上下文的状态会被保存.'''
+        cls = self.__class__
+        if cls.active is self:
+            return
+        from src.character.player import player  # 延迟导入, 避免循环导入
+        from src.character.target import target
+        if cls.active is not None:
+            cls.active.state = (
+                [{name: getattr(owner, name) for name in names} for owner, names in cls.class_state],
+                player.__dict__,
+                target.__dict__,
+                random.getstate(),
+            )
+        cls.active = self
+        if self.state is None:
+            player.__dict__ = {}
+            target.__dict__ = {}
+            Event.reset()
+            Damage.reset()
+            Skill.reset()
+            target.reset()  # target 需要先于 player 重置, 因为 player 在初始化时会设置 target 的伤害来源
+            player.reset()
+            random.seed(self.seed)
+        else:
+            class_state, player.__dict__, target.__dict__, random_state = self.state
+            for (owner, _), values in zip(cls.class_state, class_state):
+                for name, value in values.items():
+                    setattr(owner, name, value)
+            random.setstate(random_state)
+            self.state = None
+
+    def __enter__(self):
+        self.previous.append(self.__class__.active)
+        self.activate()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        previous = self.previous.pop()
+        if previous is not None:
+            previous.activate()
+
+    def run(self, func, *args, **kwargs):
+        '''在本上下文中执行 func 并返回其结果.'''
+        with self:
+            return func(*args, **kwargs)
+
+    @classmethod
+    def snapshot(cls, *objects) -> tuple:
+        '''
+            保存当前上下文的检查点, 即上述类属性, player 与 target 的实例字典, 脚本的状态, 以及 random 的状态的深复制. 之后状态的变化不会影响检查点.
+            - `objects` : 状态中引用的其他对象 (如宏, 其绑定方法位于事件列表中). 这些对象本身不被复制, 恢复时替换为 restore 的对应参数.
+        '''
+        from src.character.player import player
+        from src.character.target import target
+        memo = {id(i): i for i in (player, target, *objects)}
+        class_state = [{name: getattr(owner, name) for name in names if (owner, name) not in cls.transient} for owner, names in cls.class_state]
+        state = copy.deepcopy((class_state, player.__dict__, target.__dict__, cls.active.script_state), memo)
+        return (state, objects, random.getstate())
+
+    @classmethod
+    def restore(cls, snapshot: tuple, *objects):
+        '''
+            在当前上下文中恢复 snapshot 保存的检查点. 检查点可以被多次恢复.
+            - `objects` : 替换 snapshot 时传入的对象, 一一对应.
+        '''
+        from src.character.player import player
+        from src.character.target import target
+        state, snapshot_objects, random_state = snapshot
+        memo = {id(i): i for i in (player, target)}
+        memo.update((id(old), new) for old, new in zip(snapshot_objects, objects))
+        class_state, player.__dict__, target.__dict__, cls.active.script_state = copy.deepcopy(state, memo)
+        for (owner, _), values in zip(cls.class_state, class_state):
+            for name, value in values.items():
+                setattr(owner, name, value)
+        random.setstate(random_state)
+
+
+SimulationContext.default = SimulationContext.active = SimulationContext()
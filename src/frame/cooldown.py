@@ -7,10 +7,11 @@ class CoolDown():
     '''
         SkillEvent 类用于存放某个对象的技能 CD 并实现相关功能.
     '''
-    tabattr = TabAttr('settings/CoolDownList.tab')
+    tabattr = TabAttr('settings/CoolDownList.tab', keys=[('ID',)])
 
     def __init__(self) -> None:
         self.table = {}
+        self.version = 0  # 每次 CD 被缩短 (modify 或 clear_cd) 时自增, 见 src.frame.skills.CastPlan
         # self.df = None  # 初始化, 用于存放当前对象的所有技能 CD 列表
         pass
 
@@ -35,18 +36,21 @@ class CoolDown():
             'cooldown_duration': cooldown_duration,
         }
 
-        cooldown_tick = Event.add(int(cooldown_duration * 1024 / 16), self.over, ID)
-        self.table[ID]['cooldown_tick'] = cooldown_tick  # 将 cooldown_tick 添加至哈希表
-        return cooldown_tick
+        cooldown_event = Event.add(int(cooldown_duration * 1024 / 16), self.over, ID)
+        self.table[ID]['cooldown_event'] = cooldown_event  # 将事件句柄添加至哈希表
+        self.table[ID]['cooldown_tick'] = cooldown_event.tick  # 将 cooldown_tick 添加至哈希表
+        return cooldown_event.tick
 
     def modify(self, ID, time_tick) -> int:  # value 为正值代表增加 CD
         if ID in self.table:
+            self.version += 1
             new_cooldown_duration_tick = int(self.table[ID]['cooldown_tick'] - Event.tick + time_tick)
-            Event.delete(self.table[ID]['cooldown_tick'], self.over, ID)
+            Event.cancel(self.table[ID]['cooldown_event'])
             if new_cooldown_duration_tick > 0:
-                new_cooldown_tick = Event.add(new_cooldown_duration_tick, self.over, ID)
-                self.table[ID]['cooldown_tick'] = new_cooldown_tick
-                return new_cooldown_tick
+                new_cooldown_event = Event.add(new_cooldown_duration_tick, self.over, ID)
+                self.table[ID]['cooldown_event'] = new_cooldown_event
+                self.table[ID]['cooldown_tick'] = new_cooldown_event.tick
+                return new_cooldown_event.tick
             else:
                 self.table.pop(ID)
                 return Event.tick
@@ -57,7 +61,8 @@ class CoolDown():
 
     def clear_cd(self, ID):
         if ID in self.table:
-            Event.delete(self.table[ID]['cooldown_tick'], self.over, ID)
+            self.version += 1
+            Event.cancel(self.table[ID]['cooldown_event'])
             self.over(ID)
 
     def is_in_cd(self, ID):
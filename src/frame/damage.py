@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from typing import BinaryIO
-from src.frame.attribute import Attribute
+from src.frame.attribute import Attribute, trunc, cap
+from src.frame.damagelog import DamageLog
 from src.frame.event import Event
 from src.frame.global_param import GlobalParam
 import json
@@ -10,30 +11,50 @@ class Damage():
     """
         Damage 类为伤害列表, 用于处理伤害事件. 注意, 该类不应当被实例化.
     """
-    damage_list = []  # 伤害列表. 从 0 时刻开始起的所有伤害均记录在内.
+    damage_list = DamageLog()  # 伤害日志. 从 0 时刻开始起的所有伤害均记录在内.
     model_list = []
+    sum_damage = 0  # 期望伤害总和. 在 damagecalc_last 中实时累加.
+    skill_stat = {}  # 各技能的伤害统计, 以 (SkillID, Level) 为键. 在 damagecalc_last 中实时累加.
     _dps = 0
-    connect_queue = None
+    variant_sum_damage = 0  # 同时计算多组属性时 (见 src.worker_attrbenefit), 各组属性的期望伤害总和, 为 numpy 数组.
+    stream = None  # 伤害数据流, 见 src.frame.damagestream.DamageStream
+
+    @classmethod
+    def reset(cls):
+        '''清空伤害日志与统计. 在常驻 worker 处理下一次计算前调用.'''
+        cls.damage_list = DamageLog()
+        cls.model_list = []
+        cls.sum_damage = 0
+        cls.skill_stat = {}
+        cls._dps = 0
+        cls.variant_sum_damage = 0
+        cls.stream = None
 
     @classmethod
     @property
     def dps(cls):
         if 0 != Event.tick:
-            sum_damage = 0
-            for item in cls.damage_list:
-                sum_damage += item['damage']['except']
-            return sum_damage * 1024 / Event.tick
+            return cls.sum_damage * 1024 / Event.tick
         else:
             return cls._dps
 
+    @classmethod
+    @property
+    def variant_dps(cls):
+        '''各组属性的 dps. 下标 0 为原始属性.'''
+        if 0 != Event.tick:
+            return cls.variant_sum_damage * 1024 / Event.tick
+        else:
+            return cls.variant_sum_damage * 0
+
     @classmethod
     def damagecalc_source(cls, selfattr: Attribute, targetattr: Attribute, SkillID, Level, skill, name, skilltype, kindtype, nDamageBase, nDamageRand, nChannelInterval, nWeaponDamagePercent, surplus=False, channel_interval_cof=1, export_model=True):
         '''原始伤害计算'''
-        raw_ap = int(getattr(selfattr, f'calc{skilltype}AttackPower') * int(nChannelInterval) * channel_interval_cof / 16 / (10 if 'Physics' == skilltype else 12))
+        raw_ap = trunc(getattr(selfattr, f'calc{skilltype}AttackPower') * int(nChannelInterval) * channel_interval_cof / 16 / (10 if 'Physics' == skilltype else 12))
         if surplus:
-            raw_ap = int(selfattr.atSurplusValueBase * GlobalParam.SurplusCof() * nChannelInterval)
-        raw_min = int(nDamageBase) + raw_ap + int(selfattr.atMeleeWeaponDamageBase * nWeaponDamagePercent / 1024)
-        raw_max = int(nDamageBase + nDamageRand) + raw_ap + int((selfattr.atMeleeWeaponDamageBase + selfattr.atMeleeWeaponDamageRand) * nWeaponDamagePercent / 1024)
+            raw_ap = trunc(selfattr.atSurplusValueBase * GlobalParam.SurplusCof() * nChannelInterval)
+        raw_min = int(nDamageBase) + raw_ap + trunc(selfattr.atMeleeWeaponDamageBase * nWeaponDamagePercent / 1024)
+        raw_max = int(nDamageBase + nDamageRand) + raw_ap + trunc((selfattr.atMeleeWeaponDamageBase + selfattr.atMeleeWeaponDamageRand) * nWeaponDamagePercent / 1024)
         cof_overcome = 1024 + getattr(selfattr, f'calc{skilltype}Overcome')
         cof_damage_add_percent = 1024 + getattr(selfattr, f'calc{skilltype}DamageAddPercent')
         cof_damage_add_by_dstmovestate = 1024 + selfattr.atAddDamageByDstMoveState
@@ -43,28 +64,22 @@ class Damage():
         cof = 1 + (selfattr.level - targetattr.level) * 0.05 * (3 if selfattr.level > targetattr.level else 1)
         for i in cof_list:
             cof *= i
-        base_damage_min = int(raw_min * cof / (1024**len(cof_list)))
-        base_damage_max = int(raw_max * cof / (1024**len(cof_list)))
-        critical_damage_min = int(base_damage_min * 1.75) + int(base_damage_min * getattr(selfattr, f'calc{kindtype}CriticalDamagePower') / 1024)
-        critical_damage_max = int(base_damage_max * 1.75) + int(base_damage_max * getattr(selfattr, f'calc{kindtype}CriticalDamagePower') / 1024)
-        critical_except = min(getattr(selfattr, f'calc{kindtype}CriticalStrike'), 10000)
-        except_damage = 0
+        base_damage_min = trunc(raw_min * cof / (1024**len(cof_list)))
+        base_damage_max = trunc(raw_max * cof / (1024**len(cof_list)))
+        critical_damage_min = trunc(base_damage_min * 1.75) + trunc(base_damage_min * getattr(selfattr, f'calc{kindtype}CriticalDamagePower') / 1024)
+        critical_damage_max = trunc(base_damage_max * 1.75) + trunc(base_damage_max * getattr(selfattr, f'calc{kindtype}CriticalDamagePower') / 1024)
+        critical_except = cap(getattr(selfattr, f'calc{kindtype}CriticalStrike'), 10000)
         damage_source = {
             'HashID': f'{Event.tick}_{SkillID}_{Level}',
             'SkillID': SkillID,
             'Level': Level,
             'skill': skill,
-            'name': name,
-            'base': {
-                'min': base_damage_min,
-                'max': base_damage_max,
-            },
-            'critical': {
-                'min': critical_damage_min,
-                'max': critical_damage_max,
-            },
+            'name': name,  # 名称键, 如 ('skill', SkillID, Level). 仅在生成统计时才解析为 UI 名称, 见 src.frame.ui.UIName.
+            'base_min': base_damage_min,
+            'base_max': base_damage_max,
+            'critical_min': critical_damage_min,
+            'critical_max': critical_damage_max,
             'critical_except': critical_except,
-            'except': except_damage,
             'skilltype': skilltype,
         }
 
@@ -77,41 +92,45 @@ class Damage():
     @classmethod
     def damagecalc_last(cls, selfattr: Attribute, targetattr: Attribute, damage_source, export_model=True):
         '''最终伤害计算'''
-        def mydictcopy(src: dict):  # 递归复制一个字典. 注意, 原字典中的键值如果是可变对象, 那么必须也是字典.
-            ret = {}
-            for key in src:
-                if type(src[key]) == dict:
-                    ret[key] = mydictcopy(src[key])
-                else:
-                    ret[key] = src[key]
-            return ret
-        damage = mydictcopy(damage_source)
-        cof_shield = 1024 - getattr(targetattr, f'calc{damage["skilltype"]}Shield')
-        cof_damage_coefficient = 1024 + getattr(targetattr, f'at{damage["skilltype"]}DamageCoefficient')
-        cof_list = [cof_shield, cof_damage_coefficient]
-        cof = 1
-        for i in cof_list:
-            cof *= i
-        damage['base']['min'] = int(damage['base']['min'] * cof / (1024**len(cof_list)))
-        damage['base']['max'] = int(damage['base']['max'] * cof / (1024**len(cof_list)))
-        damage['critical']['min'] = int(damage['critical']['min'] * cof / (1024**len(cof_list)))
-        damage['critical']['max'] = int(damage['critical']['max'] * cof / (1024**len(cof_list)))
-        damage['except'] = int(((damage['base']['min'] + damage['base']['max']) / 2 * (10000 - damage['critical_except']) + (damage['critical']['min'] + damage['critical']['max']) / 2 * damage['critical_except']) / 10000)
-        # damage['用晦而明'] = self.buff.is_exist(12575)
+        skilltype = damage_source['skilltype']
+        cof_shield = 1024 - getattr(targetattr, f'calc{skilltype}Shield')
+        cof_damage_coefficient = 1024 + getattr(targetattr, f'at{skilltype}DamageCoefficient')
+        cof = cof_shield * cof_damage_coefficient
+        base_min = trunc(damage_source['base_min'] * cof / (1024**2))
+        base_max = trunc(damage_source['base_max'] * cof / (1024**2))
+        critical_min = trunc(damage_source['critical_min'] * cof / (1024**2))
+        critical_max = trunc(damage_source['critical_max'] * cof / (1024**2))
+        critical_except = trunc(damage_source['critical_except'])
+        except_damage = trunc(((base_min + base_max) / 2 * (10000 - critical_except) + (critical_min + critical_max) / 2 * critical_except) / 10000)
+        cls.variant_sum_damage = cls.variant_sum_damage + except_damage
+        if type(except_damage) != int:
+            # 同时计算多组属性, 伤害日志与统计只记录原始属性 (下标 0) 的结果
+            base_min, base_max, critical_min, critical_max, critical_except, except_damage = (int(i[0]) if hasattr(i, '__len__') else int(i) for i in (base_min, base_max, critical_min, critical_max, critical_except, except_damage))
 
-        item = {'tick': Event.tick, 'damage': damage}
-        cls.damage_list.append(item)
-
-        if cls.connect_queue is not None:
-            message = {
-                'category': 'damage',
-                'data': {
-                    'tick': Event.tick,
-                    'except': damage['except'],
-                }
+        SkillID = damage_source['SkillID']
+        Level = damage_source['Level']
+        damage = cls.damage_list.append(Event.tick, SkillID, Level, damage_source['skill'], damage_source['name'], skilltype, base_min, base_max, critical_min, critical_max, critical_except, except_damage)
+        cls.sum_damage += except_damage
+        stat = cls.skill_stat.get((SkillID, Level))
+        if stat is None:
+            cls.skill_stat[(SkillID, Level)] = {
+                'skill': damage_source['skill'],
+                'name': damage_source['name'],
+                'min': base_min,
+                'max': critical_max,
+                'critical_except': critical_except,
+                'sum_damage': except_damage,
+                'count': 1,
             }
-            # print(message)
-            cls.connect_queue.put(message)
+        else:
+            stat['min'] = min(stat['min'], base_min)
+            stat['max'] = max(stat['max'], critical_max)
+            stat['critical_except'] += critical_except
+            stat['sum_damage'] += except_damage
+            stat['count'] += 1
+
+        if cls.stream is not None:
+            cls.stream.push(Event.tick, except_damage)
 
         if export_model:
             a = ('damagecalc_last', Event.tick, (selfattr.export_stat_change(), targetattr.export_stat_change()), damage_source['HashID'])
@@ -123,30 +142,15 @@ class Damage():
     def damage_statistics(cls):
         '''伤害占比分析'''
         ret_dict = {}
-        sum_damage = 0
-        for item in cls.damage_list:
-            sum_damage += item['damage']['except']
-            if f"{item['damage']['SkillID']}_{item['damage']['Level']}" not in ret_dict:
-                ret_dict[f"{item['damage']['SkillID']}_{item['damage']['Level']}"] = {
-                    'skill': item['damage']['skill'],
-                    'name': item['damage']['name'],
-                    'min': item['damage']['base']['min'],
-                    'max': item['damage']['critical']['max'],
-                    'critical_except': item['damage']['critical_except'],
-                    'sum_damage': item['damage']['except'],
-                    'count': 1,
-                }
-            else:
-                ret_dict[f"{item['damage']['SkillID']}_{item['damage']['Level']}"]['min'] = min(ret_dict[f"{item['damage']['SkillID']}_{item['damage']['Level']}"]['min'], item['damage']['base']['min'])
-                ret_dict[f"{item['damage']['SkillID']}_{item['damage']['Level']}"]['max'] = max(ret_dict[f"{item['damage']['SkillID']}_{item['damage']['Level']}"]['max'], item['damage']['critical']['max'])
-                ret_dict[f"{item['damage']['SkillID']}_{item['damage']['Level']}"]['critical_except'] += item['damage']['critical_except']
-                ret_dict[f"{item['damage']['SkillID']}_{item['damage']['Level']}"]['sum_damage'] += item['damage']['except']
-                ret_dict[f"{item['damage']['SkillID']}_{item['damage']['Level']}"]['count'] += 1
-        for key in ret_dict:
-            ret_dict[key]['critical_except'] /= ret_dict[key]['count']
-            ret_dict[key]['count_hit'] = int(ret_dict[key]['count'] * (10000 - ret_dict[key]['critical_except']) / 10000 + 0.5)
-            ret_dict[key]['count_critical'] = int(ret_dict[key]['count'] * ret_dict[key]['critical_except'] / 10000 + 0.5)
-            ret_dict[key]['proportion'] = ret_dict[key]['sum_damage'] / sum_damage
+        from src.frame.ui import UIName  # 延迟导入, 仅在生成统计时才加载 UI 表
+        for (SkillID, Level), stat in cls.skill_stat.items():
+            item = dict(stat)
+            item['name'] = UIName.resolve(item['name'])
+            item['critical_except'] /= item['count']
+            item['count_hit'] = int(item['count'] * (10000 - item['critical_except']) / 10000 + 0.5)
+            item['count_critical'] = int(item['count'] * item['critical_except'] / 10000 + 0.5)
+            item['proportion'] = item['sum_damage'] / cls.sum_damage
+            ret_dict[f'{SkillID}_{Level}'] = item
         return ret_dict
 
     @classmethod
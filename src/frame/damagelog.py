@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from array import array
+
+
+class DamageRecord():
+    '''
+        DamageRecord 类为伤害日志中一条记录的只读视图, 可以像字典一样取值. 取值时才从日志中读取, 不会额外复制数据.
+        可用的键与旧版伤害字典相同: HashID, SkillID, Level, skill, name, base, critical, critical_except, except, skilltype.
+        其中 name 为 UI 名称 (见 DamageLog.ui_name), 日志内部保存的名称键不对外暴露.
+    '''
+    __slots__ = ('log', 'index')
+
+    def __init__(self, log, index: int) -> None:
+        self.log: DamageLog = log
+        self.index = index
+
+    def __getitem__(self, key):
+        log = self.log
+        i = self.index
+        if 'except' == key:
+            return log.except_damage[i]
+        elif 'critical_except' == key:
+            return log.critical_except[i]
+        elif 'SkillID' == key:
+            return log.SkillID[i]
+        elif 'Level' == key:
+            return log.Level[i]
+        elif 'tick' == key:
+            return log.tick[i]
+        elif 'base' == key:
+            return {'min': log.base_min[i], 'max': log.base_max[i]}
+        elif 'critical' == key:
+            return {'min': log.critical_min[i], 'max': log.critical_max[i]}
+        elif 'skill' == key:
+            return log.strings[log.skill[i]]
+        elif 'name' == key:
+            return log.ui_name(log.name[i])
+        elif 'skilltype' == key:
+            return log.strings[log.skilltype[i]]
+        elif 'HashID' == key:
+            return f'{log.tick[i]}_{log.SkillID[i]}_{log.Level[i]}'
+        raise KeyError(key)
+
+    def keys(self):
+        return ('HashID', 'SkillID', 'Level', 'skill', 'name', 'base', 'critical', 'critical_except', 'except', 'skilltype')
+
+    def to_dict(self) -> dict:
+        return {key: self[key] for key in self.keys()}
+
+
+class DamageLog():
+    '''
+        DamageLog 类为列式存储的伤害日志. 每一列都是定长整数数组, 字符串 (技能名, 名称, 伤害类型) 以驻留后的整数 id 存储.
+        按下标取值时返回 {'tick': ..., 'damage': {...}} 形式的字典, 以兼容按列表使用伤害日志的旧代码.
+    '''
+
+    def __init__(self) -> None:
+        self.tick = array('q')
+        self.SkillID = array('q')
+        self.Level = array('q')
+        self.base_min = array('q')
+        self.base_max = array('q')
+        self.critical_min = array('q')
+        self.critical_max = array('q')
+        self.critical_except = array('q')
+        self.except_damage = array('q')
+        self.skill = array('l')
+        self.name = array('l')
+        self.skilltype = array('l')
+        self.strings = []  # 驻留的字符串 (或名称键), 以其在列表中的下标作为 id
+        self.string_id = {}
+        self.ui_names = {}  # 名称键的 id -> UI 名称, 在第一次取值时解析
+
+    def intern(self, value) -> int:
+        '''驻留字符串 (或其他可哈希的名称键), 返回其 id.'''
+        ret = self.string_id.get(value)
+        if ret is None:
+            ret = len(self.strings)
+            self.strings.append(value)
+            self.string_id[value] = ret
+        return ret
+
+    def ui_name(self, name_id: int) -> str:
+        '''将名称键解析为 UI 名称, 见 src.frame.ui.UIName.'''
+        ret = self.ui_names.get(name_id)
+        if ret is None:
+            from src.frame.ui import UIName  # 延迟导入, 仅在取值时才加载 UI 表
+            ret = self.ui_names[name_id] = UIName.resolve(self.strings[name_id])
+        return ret
+
+    def append(self, tick, SkillID, Level, skill, name, skilltype, base_min, base_max, critical_min, critical_max, critical_except, except_damage) -> DamageRecord:
+        self.tick.append(tick)
+        self.SkillID.append(SkillID)
+        self.Level.append(Level)
+        self.base_min.append(base_min)
+        self.base_max.append(base_max)
+        self.critical_min.append(critical_min)
+        self.critical_max.append(critical_max)
+        self.critical_except.append(critical_except)
+        self.except_damage.append(except_damage)
+        self.skill.append(self.intern(skill))
+        self.name.append(self.intern(name))
+        self.skilltype.append(self.intern(skilltype))
+        return DamageRecord(self, len(self.tick) - 1)
+
+    def record(self, index: int) -> DamageRecord:
+        if index < 0:
+            index += len(self.tick)
+        if index < 0 or index >= len(self.tick):
+            raise IndexError('Damage log index out of range.')
+        return DamageRecord(self, index)
+
+    def __len__(self):
+        return len(self.tick)
+
+    def __getitem__(self, index: int) -> dict:
+        record = self.record(index)
+        return {'tick': self.tick[record.index], 'damage': record.to_dict()}
+
+    def __iter__(self):
+        for i in range(len(self.tick)):
+            yield self[i]
+
+    def clear(self):
+        self.__init__()
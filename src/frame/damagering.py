@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+from multiprocessing import shared_memory
+import struct
+import time
+
+
+class DamageRing():
+    '''
+        DamageRing 类为子进程 (写入方) 与服务进程 (读取方) 之间传递伤害数据的环形缓冲区, 位于共享内存中.
+
+        缓冲区的前 24 字节为写入序号, 读取序号 (均为单调递增的 64 位整数) 与放弃标志, 之后为 size 条定长记录, 每条记录为 (tick, 期望伤害) 两个 64 位整数.
+        写入方每写入一批记录, 就通过原有的消息队列发送一条门铃消息 (见 doorbell), 其中包含这批记录的起始序号与条数. 读取方按门铃消息一次性读出整批记录 (见 read), 并推进读取序号.
+        因此伤害数据无需逐条序列化, 而门铃消息与其他消息在同一队列中, 顺序保持不变.
+        缓冲区已满时, 写入方等待读取方推进读取序号, 但最多等待 timeout 秒. 读取方不再需要本次计算的伤害数据时设置放弃标志 (见 abort), 写入方不再等待.
+    '''
+    header_size = 24
+    record = struct.Struct('<qq')
+    size = 65536  # 记录条数. 不从共享内存的大小推算, 因为部分平台会将其向上取整至页大小
+    timeout = 5.0  # 缓冲区已满时写入方最多等待的时间 (秒)
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool) -> None:
+        self.shm = shm
+        self.owner = owner  # 是否为创建者 (服务进程). 创建者负责释放共享内存.
+        self.buf = shm.buf
+        # 头部以对齐的 64 位整数读写 (共享内存按页对齐), 每次读写都是单条指令. struct.pack_into 会先将目标清零再写入, 对方可能读到 0, 因此不用于头部.
+        self.counters = self.buf[:self.header_size].cast('q')  # [写入序号, 读取序号, 放弃标志]
+        self.written, self.read_index = self.counters[0], self.counters[1]  # 写入序号 (子进程重新启动时从共享内存中恢复), 以及最近一次得知的读取序号
+        self.pending = self.written  # 尚未发送门铃消息的第一条记录的序号
+
+    @classmethod
+    def create(cls):
+        '''在服务进程中创建缓冲区.'''
+        shm = shared_memory.SharedMemory(create=True, size=cls.header_size + cls.size * cls.record.size)
+        shm.buf[:cls.header_size] = bytes(cls.header_size)
+        return cls(shm, True)
+
+    @classmethod
+    def attach(cls, name: str):
+        '''在子进程中连接至服务进程创建的缓冲区.'''
+        return cls(shared_memory.SharedMemory(name=name), False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def wait(self, count: int) -> bool:
+        '''
+            等待缓冲区中有 count 条空闲记录. 只在缓存的读取序号显示空间不足时才读取共享内存.
+            等待超过 timeout 秒, 或读取方已放弃时返回 False.
+        '''
+        deadline = None
+        while self.written + count - self.read_index > self.size:
+            self.read_index = self.counters[1]
+            if self.written + count - self.read_index > self.size:  # 缓冲区已满
+                if self.counters[2]:
+                    return False
+                now = time.perf_counter()
+                if deadline is None:
+                    deadline = now + self.timeout
+                elif now >= deadline:
+                    return False
+                time.sleep(0.001)
+        return True
+
+    def write(self, tick: int, except_damage: int) -> bool:
+        '''写入一条记录. 缓冲区已满且等待超时, 或读取方已放弃时不写入, 并返回 False.'''
+        if not self.wait(1):
+            return False
+        written = self.written
+        self.record.pack_into(self.buf, self.header_size + (written % self.size) * self.record.size, tick, except_damage)
+        self.written = written + 1
+        self.counters[0] = self.written  # 记录写入完毕后才推进写入序号
+        return True
+
+    @property
+    def aborted(self) -> bool:
+        return self.counters[2] != 0
+
+    def abort(self, value: bool = True):
+        '''由读取方设置 (或在每次计算开始前清除) 放弃标志.'''
+        self.counters[2] = 1 if value else 0
+
+    @property
+    def pending_count(self) -> int:
+        return self.written - self.pending
+
+    def doorbell(self) -> tuple:
+        '''返回自上一条门铃消息以来写入的记录的门铃消息 ('damage_ring', 起始序号, 条数). 没有新记录时返回 None.'''
+        if self.written == self.pending:
+            return None
+        ret = ('damage_ring', self.pending, self.written - self.pending)
+        self.pending = self.written
+        return ret
+
+    def read(self, start: int, count: int) -> tuple:
+        '''读出序号从 start 开始的 count 条记录, 返回 (tick 列表, 期望伤害列表).'''
+        if start + count > self.counters[0]:
+            raise RuntimeError('Damage ring is out of sync.')
+        tick = []
+        except_damage = []
+        record_size = self.record.size
+        begin = start % self.size
+        while count > 0:
+            n = min(count, self.size - begin)  # 到达缓冲区末尾时折返
+            offset = self.header_size + begin * record_size
+            for t, e in self.record.iter_unpack(self.buf[offset:offset + n * record_size]):
+                tick.append(t)
+                except_damage.append(e)
+            count -= n
+            begin = 0
+            start += n
+        self.counters[1] = start
+        return tick, except_damage
+
+    def close(self):
+        self.counters.release()
+        self.counters = None
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
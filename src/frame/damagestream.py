@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import time
+
+
+class DamageStream():
+    '''
+        DamageStream 类用于将伤害数据从子进程发送至主进程.
+
+        未设置任何选项时, 每次伤害发送一条 'damage' 消息 (旧协议).
+        设置选项后, 伤害会被合并为帧, 每帧发送一条 'damage_batch' 消息. 可用的选项 (均可省略):
+        - `interval` : 每帧覆盖的最长战斗时间, 单位为毫秒 (战斗内时间, 而非现实时间).
+        - `count` : 每帧最多包含的伤害次数.
+        - `points` : 整条伤害曲线的目标点数. 需要知道战斗时长, 此时同一时间桶内的伤害会被合并为一个点.
+        - `duration` : 战斗时长的估计值, 单位为秒. 仅在 `points` 生效时使用; 若调用方已知战斗时长 (如回放模型时), 则以调用方为准.
+
+        未设置任何选项且给定共享内存中的环形缓冲区 (见 src.frame.damagering.DamageRing) 时, 伤害数据写入缓冲区, 而队列中只发送门铃消息, 由服务进程将每条门铃消息对应的伤害作为一条 'damage_batch' 消息发送 (不合并).
+        每 doorbell_count 条伤害或每 doorbell_interval 秒 (现实时间) 发送一次门铃消息. 合并为帧时, 每帧本身已是一条消息, 因此不使用缓冲区.
+        缓冲区写入超时 (服务进程读取过慢) 时, 本次计算余下的伤害改为通过队列发送, 每 doorbell_count 条伤害一帧; 服务进程放弃本次计算时, 余下的伤害被丢弃.
+    '''
+    doorbell_count = 256
+    doorbell_interval = 0.05
+
+    def __init__(self, queue, options: dict = None, duration_tick: int = None, ring=None) -> None:
+        self.queue = queue
+        self.ring = ring
+        self.doorbell_time = time.perf_counter()
+        self.batch = options is not None
+        options = options if options is not None else {}
+        self.interval_tick = int(options['interval'] * 1024 / 1000) if options.get('interval') else 0
+        self.count = int(options['count']) if options.get('count') else 0
+        if duration_tick is None and options.get('duration'):
+            duration_tick = int(options['duration'] * 1024)
+        self.bucket_tick = 0  # 时间桶宽度. 为 0 时不合并伤害.
+        if options.get('points') and duration_tick:
+            self.bucket_tick = max(1, duration_tick // int(options['points']))
+        self.frame_tick = []
+        self.frame_except = []
+        self.frame_begin = 0
+        self.bucket_begin = None
+        self.dropped = False  # 服务进程已放弃本次计算, 不再发送伤害
+
+    def push(self, tick: int, except_damage: int):
+        if self.dropped:
+            return
+        if not self.batch and self.ring is not None:
+            if self.ring.write(tick, except_damage):
+                if self.ring.pending_count >= self.doorbell_count or time.perf_counter() - self.doorbell_time >= self.doorbell_interval:
+                    self.doorbell()
+                return
+            self.doorbell()  # 已写入缓冲区的伤害照常发送
+            if self.dropped:
+                return
+            print('Warning: Damage ring is full, fall back to queue.')
+            self.ring = None
+            self.batch = True
+            self.count = self.doorbell_count
+        if not self.batch:
+            self.queue.put({
+                'category': 'damage',
+                'data': {
+                    'tick': tick,
+                    'except': except_damage,
+                }
+            })
+            return
+        if self.bucket_begin is not None and tick - self.bucket_begin < self.bucket_tick:
+            # 与上一个点处于同一时间桶内, 合并为一个点
+            self.frame_tick[-1] = tick
+            self.frame_except[-1] += except_damage
+            return
+        if len(self.frame_tick) > 0 and ((self.interval_tick > 0 and tick - self.frame_begin >= self.interval_tick) or (self.count > 0 and len(self.frame_tick) >= self.count)):
+            self.flush()
+        if len(self.frame_tick) == 0:
+            self.frame_begin = tick
+        self.bucket_begin = tick if self.bucket_tick > 0 else None
+        self.frame_tick.append(tick)
+        self.frame_except.append(except_damage)
+
+    def flush(self):
+        '''发送当前帧.'''
+        if len(self.frame_tick) == 0:
+            return
+        self.queue.put({
+            'category': 'damage_batch',
+            'data': {
+                'tick': self.frame_tick,
+                'except': self.frame_except,
+            }
+        })
+        self.frame_tick = []
+        self.frame_except = []
+        self.bucket_begin = None
+
+    def doorbell(self):
+        message = self.ring.doorbell()
+        if message is not None:
+            self.queue.put(message)
+        self.doorbell_time = time.perf_counter()
+        if self.ring.aborted:
+            self.dropped = True
+
+    def close(self):
+        '''战斗结束时调用, 发送尚未发送的伤害.'''
+        self.flush()
+        if not self.batch and self.ring is not None:
+            self.doorbell()
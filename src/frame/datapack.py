@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+import hashlib
+import json
+import mmap
+import operator
+import os
+import struct
+
+
+NULL_INT = -2**63  # 整数列的空值
+
+
+class PackTable():
+    '''
+        PackTable 类为数据包中的一张表. 数据按列存储在数据包中, 只有在某一行被读取时才解码为 TabRow, 解码结果会被缓存.
+        列类型:
+        - 'q' : 64 位整数, 空值为 NULL_INT.
+        - 'd' : 64 位浮点数, 空值为 NaN.
+        - 's' : 字符串, 存储为字符串池中的 32 位下标, 空值为 -1.
+        - 'o' : 混合类型 (如 buff.tab 中的属性值), 以 json 编码后存入字符串池.
+    '''
+
+    def __init__(self, pack, info: dict) -> None:
+        from src.frame.fetchdata import TabRow  # 延迟导入, 避免循环导入
+        self.TabRow = TabRow
+        self.name = info['name']
+        self.source = info['source']
+        self.nrows = info['rows']
+        buf = pack.buf
+        self.columns = {name: i for i, (name, _, _) in enumerate(info['columns'])}
+        self.column_type = [t for _, t, _ in info['columns']]
+        self.column_data = []
+        for _, t, offset in info['columns']:
+            if 'q' == t or 'd' == t:
+                self.column_data.append(buf[offset:offset + 8 * self.nrows].cast(t))
+            else:
+                self.column_data.append(buf[offset:offset + 4 * self.nrows].cast('i'))
+        string_offset, string_count, blob_offset, blob_len = info['strings']
+        self.string_offset = buf[string_offset:string_offset + 8 * (string_count + 1)].cast('q')
+        self.string_blob = buf[blob_offset:blob_offset + blob_len]
+        self.strings = {}  # 已解码的字符串
+        self.index = {}  # 查询键 -> (键数组, 行号数组), 见 DataPack.build
+        for key, keys_offset, rows_offset, count in info['index']:
+            self.index[tuple(key)] = (buf[keys_offset:keys_offset + 8 * count].cast('q'), buf[rows_offset:rows_offset + 4 * count].cast('i'))
+        self.row_index = {}  # 数据包中没有预先计算的查询键, 在第一次查询时建立字典索引
+        self.rows = {}  # 已解码的行
+
+    def string(self, i: int) -> str:
+        ret = self.strings.get(i)
+        if ret is None:
+            ret = self.strings[i] = bytes(self.string_blob[self.string_offset[i]:self.string_offset[i + 1]]).decode('utf-8')
+        return ret
+
+    def value(self, column: int, i: int):
+        t = self.column_type[column]
+        x = self.column_data[column][i]
+        if 'q' == t:
+            return None if NULL_INT == x else x
+        elif 'd' == t:
+            return None if x != x else x
+        elif x < 0:
+            return None
+        elif 's' == t:
+            return self.string(x)
+        else:
+            return json.loads(self.string(x))
+
+    def row(self, i: int):
+        ret = self.rows.get(i)
+        if ret is None:
+            ret = self.rows[i] = self.TabRow(self.columns, tuple(self.value(c, i) for c in range(len(self.column_type))))
+        return ret
+
+    def lookup(self, key: tuple, value) -> list:
+        '''返回查询键 key 的值为 value 的所有行 (TabRow 的列表). 找不到时返回 None.'''
+        index = self.index.get(key)
+        if index is not None:
+            composite = DataPack.composite(value)
+            if composite is None:
+                return None
+            keys, rows = index
+            begin = bisect_left(keys, composite)
+            end = bisect_right(keys, composite, begin)
+            return [self.row(rows[i]) for i in range(begin, end)] if begin < end else None
+        index = self.row_index.get(key)
+        if index is None:
+            index = self.row_index[key] = {}
+            position = [self.columns[i] for i in key]
+            for i in range(self.nrows):
+                index.setdefault(tuple(self.value(c, i) for c in position), []).append(i)
+        ret = index.get(tuple(value))
+        return [self.row(i) for i in ret] if ret is not None else None
+
+
+class DataPack():
+    '''
+        DataPack 类用于读取和生成数据包 (data/datapack.bin). 注意, 该类不应被实例化.
+
+        数据包将 data 中所有用到的表编译为一个文件, 以 mmap 方式打开. 多个进程打开同一数据包时共享页缓存, 且无需反序列化 pandas.DataFrame.
+        文件格式: MAGIC, 版本号 (uint32), 目录长度 (uint64), json 目录, 随后是按 8 字节对齐的各列数据, 字符串池与索引.
+        目录为 {'digest': 内容摘要, 'tables': [表信息]}. 内容摘要只由各表的数据决定 (见 build), 用作数据的版本, 见 content_version. 早期的数据包中目录直接为表信息的列表.
+        查询键由不超过 2 个整数列组成时, 会预先计算排序后的键数组, 查询时二分查找.
+    '''
+    MAGIC = b'JX3PACK\x00'
+    VERSION = 1
+    path = 'data/datapack.bin'
+    buf = None  # mmap 的 memoryview
+    tables = None  # 表名 -> 表信息 (尚未打开) 或 PackTable
+    digests = {}  # 文件路径 -> ((st_mtime_ns, st_size), 内容摘要), 见 content_version 与 file_digest
+
+    @classmethod
+    def load(cls):
+        '''打开数据包. 数据包不存在或版本不符时, tables 为空字典.'''
+        cls.tables = {}
+        try:
+            with open(cls.path, 'rb') as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        head = struct.calcsize('<8sIQ')
+        try:
+            magic, version, dir_len = struct.unpack_from('<8sIQ', m, 0)
+        except struct.error:
+            magic, version, dir_len = None, None, 0
+        if cls.MAGIC != magic or cls.VERSION != version:
+            m.close()
+            return
+        cls.buf = memoryview(m)
+        directory = json.loads(bytes(cls.buf[head:head + dir_len]).decode('utf-8'))
+        for info in directory['tables'] if type(directory) == dict else directory:
+            cls.tables[info['name']] = info
+
+    @classmethod
+    def table(cls, name: str, source: Path = None):
+        '''
+            获取数据包中的表. 不存在时返回 None.
+            - `source` : 该表的原始数据文件 (data/*.bin). 若该文件比数据包中记录的更新, 说明数据包已过期, 同样返回 None.
+        '''
+        if cls.tables is None:
+            cls.load()
+        ret = cls.tables.get(name)
+        if ret is None:
+            return None
+        if type(ret) == dict:
+            ret = cls.tables[name] = PackTable(cls, ret)
+        if source is not None and source.exists() and cls.source_stat(source) != ret.source:
+            return None
+        return ret
+
+    @staticmethod
+    def source_stat(source: Path):
+        stat = source.stat()
+        return [stat.st_mtime_ns, stat.st_size]
+
+    @classmethod
+    def content_version(cls) -> str:
+        '''
+            数据包的内容版本, 即目录中的内容摘要. 重新生成内容相同的数据包时, 内容版本不变. 数据包不存在或版本不符时返回 None.
+            结果以文件的 stat 缓存, 文件未变化时只需一次 stat.
+        '''
+        try:
+            stat = os.stat(cls.path)
+        except OSError:
+            return None
+        cached = cls.digests.get(cls.path)
+        if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+        head = struct.calcsize('<8sIQ')
+        with open(cls.path, 'rb') as f:
+            try:
+                magic, version, dir_len = struct.unpack('<8sIQ', f.read(head))
+            except struct.error:
+                return None
+            if cls.MAGIC != magic or cls.VERSION != version:
+                return None
+            directory = json.loads(f.read(dir_len).decode('utf-8'))
+        if type(directory) == dict:
+            ret = directory['digest']
+        else:  # 早期的数据包没有内容摘要, 以整个文件的摘要代替
+            ret = cls.file_digest(Path(cls.path))
+        cls.digests[cls.path] = ((stat.st_mtime_ns, stat.st_size), ret)
+        return ret
+
+    @classmethod
+    def file_digest(cls, path: Path) -> str:
+        '''文件内容的 sha256. 结果以文件的 stat 缓存.'''
+        stat = path.stat()
+        key = str(path)
+        cached = cls.digests.get(key)
+        if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                h.update(chunk)
+        ret = h.hexdigest()
+        cls.digests[key] = ((stat.st_mtime_ns, stat.st_size), ret)
+        return ret
+
+    @staticmethod
+    def composite(value):
+        '''将不超过 2 个整数组成的键值合并为一个 64 位整数. 无法合并时返回 None.'''
+        try:
+            value = [operator.index(v) for v in value]  # 同时接受 numpy 整数
+        except TypeError:
+            return None
+        if len(value) == 1:
+            v = value[0]
+            return v if -2**63 < v < 2**63 else None
+        elif len(value) == 2:
+            v0, v1 = value
+            if -2**31 <= v0 < 2**31 and -2**31 <= v1 < 2**31:
+                return v0 * 2**32 + v1 + 2**31
+        return None
+
+    @classmethod
+    def build(cls, table_list: list):
+        '''
+            生成数据包. 本方法应当只在开发环境中被调用.
+            - `table_list` : 元素为 (表名, pandas.DataFrame, 查询键的列表, 原始数据文件).
+        '''
+        from src.frame.fetchdata import TabAttr
+        data = bytearray()
+        directory = []
+        for name, df, keys, source in table_list:
+            nrows = len(df)
+            pool = []
+            pool_id = {}
+
+            def intern(s: str) -> int:
+                ret = pool_id.get(s)
+                if ret is None:
+                    ret = pool_id[s] = len(pool)
+                    pool.append(s)
+                return ret
+
+            columns = []
+            column_value = {}
+            for col in df.columns:
+                values = [TabAttr.to_value(x) for x in df[col]]
+                column_value[col] = values
+                kind = {type(x) for x in values if x is not None}
+                if kind <= {int, bool}:
+                    t, arr = 'q', array('q', (NULL_INT if x is None else int(x) for x in values))
+                elif kind <= {float}:
+                    t, arr = 'd', array('d', (float('nan') if x is None else x for x in values))
+                elif kind <= {str}:
+                    t, arr = 's', array('i', (-1 if x is None else intern(x) for x in values))
+                else:
+                    t, arr = 'o', array('i', (-1 if x is None else intern(json.dumps(x, ensure_ascii=False)) for x in values))
+                columns.append([str(col), t, cls.append(data, arr.tobytes())])
+            blob = bytearray()
+            offset = array('q', [0])
+            for s in pool:
+                blob += s.encode('utf-8')
+                offset.append(len(blob))
+            strings = [cls.append(data, offset.tobytes()), len(pool), cls.append(data, bytes(blob)), len(blob)]
+            index = []
+            for key in keys:
+                key = list(key)
+                if len(key) > 2 or any(i not in column_value for i in key):
+                    continue
+                composite = [cls.composite([column_value[i][r] for i in key]) for r in range(nrows)]
+                if None in composite:
+                    continue
+                order = sorted(range(nrows), key=lambda r: composite[r])
+                keys_offset = cls.append(data, array('q', (composite[r] for r in order)).tobytes())
+                rows_offset = cls.append(data, array('i', order).tobytes())
+                index.append([key, keys_offset, rows_offset, nrows])
+            directory.append({
+                'name': name,
+                'source': cls.source_stat(source) if source is not None and source.exists() else None,
+                'rows': nrows,
+                'columns': columns,
+                'strings': strings,
+                'index': index,
+            })
+        # 内容摘要由数据区与 (不含原始数据文件的 stat 的) 目录决定, 与生成时间无关
+        h = hashlib.sha256(data)
+        h.update(json.dumps([dict(info, source=None) for info in directory], ensure_ascii=False, sort_keys=True).encode('utf-8'))
+        digest = h.hexdigest()
+        # 目录中的偏移量以数据区起点计, 写入时统一加上文件头与目录的长度. 偏移量的位数会影响目录长度, 因此重复计算直至数据区起点不再后移.
+        head = struct.calcsize('<8sIQ')
+        base = head
+        while True:
+            dir_bytes = json.dumps({'digest': digest, 'tables': cls.relocate(directory, base)}, ensure_ascii=False).encode('utf-8')
+            new_base = (head + len(dir_bytes) + 7) // 8 * 8
+            if new_base <= base:
+                break
+            base = new_base
+        dir_bytes = dir_bytes.ljust(base - head, b' ')
+        tmp = f'{cls.path}.tmp{os.getpid()}'
+        with open(tmp, 'wb') as f:
+            f.write(struct.pack('<8sIQ', cls.MAGIC, cls.VERSION, len(dir_bytes)))
+            f.write(dir_bytes)
+            f.write(data)
+        os.replace(tmp, cls.path)  # 正在使用旧数据包的进程不受影响
+        cls.tables = None
+        cls.buf = None
+
+    @staticmethod
+    def append(data: bytearray, b: bytes) -> int:
+        '''将 b 按 8 字节对齐追加至 data, 返回其偏移量.'''
+        data += b'\x00' * (-len(data) % 8)
+        offset = len(data)
+        data += b
+        return offset
+
+    @staticmethod
+    def relocate(directory: list, base: int) -> list:
+        ret = []
+        for info in directory:
+            info = dict(info)
+            info['columns'] = [[name, t, offset + base] for name, t, offset in info['columns']]
+            string_offset, string_count, blob_offset, blob_len = info['strings']
+            info['strings'] = [string_offset + base, string_count, blob_offset + base, blob_len]
+            info['index'] = [[key, keys_offset + base, rows_offset + base, count] for key, keys_offset, rows_offset, count in info['index']]
+            ret.append(info)
+        return ret
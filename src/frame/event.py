@@ -1,67 +1,94 @@
 # -*- coding: utf-8 -*-
-import bisect
+import heapq
+
+
+class EventHandle():
+    '''
+        EventHandle 类为事件句柄, 由 Event.add 返回. 持有句柄即可通过 Event.cancel 以 O(1) 的代价取消事件.
+    '''
+    __slots__ = ('tick', 'func', 'args', 'kwargs')
+
+    def __init__(self, tick: int, func, args, kwargs) -> None:
+        self.tick = tick  # 处理事件的 tick
+        self.func = func  # 事件处理函数. 事件被处理或被取消后置为 None (即墓碑标记).
+        self.args = args
+        self.kwargs = kwargs
+
+    @property
+    def alive(self):
+        '''事件是否仍在等待处理.'''
+        return self.func is not None
 
 
 class Event():
     '''
         Event 类为事件列表, 用于处理时间线上的事件. 注意, 该类不应被实例化.
+
+        事件列表是一个二叉堆, 堆中的元素为 (tick, seq, handle). seq 为事件的添加序号, 保证同一 tick 的事件按添加顺序处理.
+        取消事件时不会立即将其移出堆, 而是将句柄标记为墓碑, 待其被弹出时跳过. 当墓碑过多时会重建堆.
     '''
     tick = 0  # 时间线. 每 1024 tick 为 1 秒.
-    tick_list = []  # 待处理事件列表对应的 tick. 应当始终按时间升序排列.
-    event_list = []  # 待处理事件列表. 应当始终按时间升序排列.
+    heap = []  # 待处理事件的二叉堆.
+    count = 0  # 待处理事件的数量 (不包括已取消的事件).
+    seq = 0  # 事件添加序号.
 
     @classmethod
-    def add(cls, tick: int, func, *args, **kwargs) -> int:
+    def add(cls, tick: int, func, *args, **kwargs) -> EventHandle:
         '''
             添加事件. 注意传入的参数:
             - `tick` : 离处理事件的 tick 数.
             - `func` : 事件处理函数.
             - `*args`, `**kwargs` : 事件处理函数的参数.
 
-            返回值为事件处理瞬间的 tick.
+            返回值为事件句柄, 其 tick 属性为事件处理瞬间的 tick.
         '''
         if type(tick) != int:
             raise RuntimeError('Tick must be of type int.')
-        handle_tick = cls.tick + tick  # 获取处理事件的 tick
-        index = bisect.bisect_left(cls.tick_list, handle_tick)
-        cls.tick_list.insert(index, handle_tick)  # 插入待处理事件列表
-        cls.event_list.insert(index, (func, args, kwargs))  # 插入待处理事件列表对应的 tick
-        return handle_tick
+        handle = EventHandle(cls.tick + tick, func, args, kwargs)  # 获取处理事件的 tick
+        heapq.heappush(cls.heap, (handle.tick, cls.seq, handle))
+        cls.seq += 1
+        cls.count += 1
+        return handle
 
     @classmethod
     def handle(cls):  # 处理一次事件
-        if 0 == len(cls.tick_list):
-            # 若事件列表为空, 则直接返回.
+        while len(cls.heap) > 0:
+            tick, _, handle = heapq.heappop(cls.heap)
+            func = handle.func
+            if func is None:  # 已被取消的事件, 跳过
+                continue
+            cls.tick = tick  # 步进时间
+            handle.func = None
+            cls.count -= 1
+            func(*handle.args, **handle.kwargs)  # 执行处理事件函数
             return
-        # print('\n开始处理下一次事件...', end='')
-        cls.tick = cls.tick_list.pop(0)  # 取出第一个事件的处理 tick, 并将其赋给 cls.tick (步进时间).
-        func, args, kwargs = cls.event_list.pop(0)  # 取出第一个事件的处理函数和参数
-        # print(cls.tick, func, args, kwargs)
-        func(*args, **kwargs)  # 执行处理事件函数
-        if 0 == len(cls.tick_list):
-            # 如果此时事件列表为空, 则计算 dps 并记录
-            cls._dps = cls.dps  # 语法糖, 实际上是通过 getter 拿到当前的 dps 并通过 setter 赋给 cls._dps
-            # cls.damage_list.clear()  # 将伤害列表置空
-            # cls.tick = 0  # 重置时间
-        # print('处理完毕!')
 
-    # @classmethod
-    # def clear(cls):
-    #     if len(cls.tick_list) > 0:
-    #         raise RuntimeError('Event list is not empty, cannot clear.')
-    #     else:
-    #         # cls.damage_list.clear()  # 将伤害列表置空
-    #         cls.tick = 0  # 重置时间
+    @classmethod
+    def reset(cls):
+        '''清空事件列表并将时间线归零. 在常驻 worker 处理下一次计算前调用.'''
+        cls.tick = 0
+        cls.heap = []
+        cls.count = 0
+        cls.seq = 0
+
+    @classmethod
+    def cancel(cls, handle: EventHandle) -> bool:
+        '''取消事件. 若事件已被处理或已被取消, 则返回 False.'''
+        if handle is None or handle.func is None:
+            return False
+        handle.func = None
+        cls.count -= 1
+        if len(cls.heap) > 64 and cls.count * 2 < len(cls.heap):
+            # 墓碑数量超过一半时重建堆, 避免堆无限增长
+            cls.heap = [i for i in cls.heap if i[2].func is not None]
+            heapq.heapify(cls.heap)
+        return True
 
     @classmethod
     def delete(cls, tick: int, func, *args, **kwargs) -> bool:
-        '''提前移除事件.'''
-        index = bisect.bisect_left(cls.tick_list, tick)
-        while cls.tick_list[index] == tick:
-            if func == cls.event_list[index][0] and args == cls.event_list[index][1] and kwargs == cls.event_list[index][2]:
-                cls.tick_list.pop(index)  # 取出事件处理 tick
-                cls.event_list.pop(index)  # 取出事件的处理函数
-                return True
-            else:
-                index += 1
+        '''提前移除事件. 需要遍历事件列表, 应当优先持有 Event.add 返回的句柄并使用 Event.cancel.'''
+        for i in cls.heap:
+            handle = i[2]
+            if i[0] == tick and func == handle.func and args == handle.args and kwargs == handle.kwargs:
+                return cls.cancel(handle)
         return False
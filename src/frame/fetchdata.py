@@ -1,25 +1,74 @@
 # -*- coding: utf-8 -*-
-import pandas as pd
+from src.frame.datapack import DataPack
 import pickle
 from pathlib import Path
 
 
+class TabRow():
+    '''
+        TabRow 类为表中一行数据的只读记录, 由 TabAttr.fetch 返回. 可以像 pd.Series 一样以列名取值, 空值为 None.
+        同一张表的所有记录共用一个列名到下标的字典, 记录本身只保存一个值的元组.
+    '''
+    __slots__ = ('columns', 'values')
+
+    def __init__(self, columns: dict, values: tuple) -> None:
+        self.columns = columns  # 列名 -> 下标
+        self.values = values
+
+    def __getitem__(self, key):
+        return self.values[self.columns[key]]
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def __deepcopy__(self, memo):
+        return self  # 只读记录, 保存模拟状态时无需复制 (见 src.frame.context.SimulationContext.snapshot)
+
+    def get(self, key, default=None):
+        i = self.columns.get(key)
+        return default if i is None else self.values[i]
+
+    def keys(self):
+        return self.columns.keys()
+
+    def to_series(self, name=None):
+        '''转换为 pd.Series, 以便与仍使用 DataFrame 的代码配合. 空值转换回 pd.NA.'''
+        import pandas as pd
+        return pd.Series({k: pd.NA if v is None else v for k, v in zip(self.columns, self.values)}, name=name, dtype='object')
+
+
 class TabAttr():
     '''
         该类用于获取表数据(如 buff.tab, skills.tab, recipeSkill.tab 等)的属性.
+
+        pandas 只在需要读取 DataFrame 时 (数据包不可用, 或需要从 pak 包中补充数据) 才被导入.
+        数据加载后会被转换为 TabRow 记录. 每种查询键 (如 'SkillID', ('ID', 'Level')) 在第一次查询时建立一个哈希索引, 之后的查询均为字典查找.
     '''
     instance = []
 
-    def __init__(self, pathstr: str) -> None:
+    def __init__(self, pathstr: str, keys: list = None) -> None:
+        '''
+            - `pathstr` : 表在 pak 包中的路径.
+            - `keys` : 该表常用的查询键, 如 [('ID', 'Level')]. 生成数据包时会为这些查询键预先建立索引, 见 src.frame.datapack.
+        '''
         self.path = 'pak' / Path(pathstr)
-        self.index = []
+        self.name = f'{self.path.stem}{self.path.suffix[1:]}'
+        self.keys = [tuple(i) for i in keys] if keys is not None else []
+        self.rows = []  # 所有记录
+        self.row_index = {}  # 查询键 -> {键值: [记录]}
         self.data_loaded = False
-        self.data_index_changed = False
         self.pakdata_loaded = False
-        self.pakdata_index_changed = False
         self.rows_added = 0
+        self.pack = DataPack.table(self.name, Path(f'data/{self.name}.bin'))  # 优先从数据包中读取
+        if self.pack is None:
+            self.load_data()
+        self.__class__.instance.append(self)
+        # print(f'Init {self.path} over.')
+
+    def load_data(self):
+        '''从 data 包中的二进制文件加载数据. 数据包不可用或需要从 pak 包中补充数据时调用.'''
         try:  # 尝试打开二进制文件以获取数据
-            with open(f'data/{self.path.stem}{self.path.suffix[1:]}.bin', 'rb') as f:
+            with open(f'data/{self.name}.bin', 'rb') as f:
                 self.df = pickle.load(f)
                 self.data_loaded = True
         except:  # 打开失败
@@ -29,19 +78,15 @@ class TabAttr():
                     self.pakdata_loaded = True  # 设置已加载标志, 防止再次加载.
                 except:
                     raise RuntimeError(f'{self.path} loads failed, need pak file as data source.')
-        # try:
-        #     self.load_pakdata()
-        #     self.pakdata_loaded = True  # 设置已加载标志, 防止再次加载.
-        # except:
-        #     pass
-        self.__class__.instance.append(self)
-        # print(f'Init {self.path} over.')
+        self.build_rows()
+        self.pack = None
 
     def load_pakdata(self):
         '''
             尝试加载 pak 包中完整的 tab. 该方法应当只在开发环境中被确实调用.
             在生产环境中, 应当保证 data 包中包含所有要使用的数据.
         '''
+        import pandas as pd
         # 打开以获取表头
         self.df_pak = pd.read_table(self.path, encoding='gbk', low_memory=False)
         for col in self.df_pak.columns:
@@ -61,34 +106,62 @@ class TabAttr():
             self.data_loaded = True
         print(f'Warning: Load pak data file {self.path}.')
 
-    def fetch(self, key, value, alternative_value_list=None):
+    def build_rows(self):
+        '''由 self.df 重建所有记录, 并清空索引.'''
+        self.columns = {name: i for i, name in enumerate(self.df.columns)}
+        self.rows = [TabRow(self.columns, tuple(self.to_value(x) for x in values)) for values in self.df.itertuples(index=False, name=None)]
+        self.row_index = {}
+
+    @staticmethod
+    def to_value(x):
+        '''将 pandas 中的值转换为 Python 值. 空值转换为 None.'''
+        if x is None or (type(x) == float and x != x) or 'NAType' == type(x).__name__:  # None, NaN 或 pd.NA
+            return None
+        if hasattr(x, 'item'):  # numpy 标量
+            return x.item()
+        return x
+
+    def get_index(self, key: tuple) -> dict:
+        '''获取查询键对应的索引, 不存在时建立.'''
+        index = self.row_index.get(key)
+        if index is None:
+            index = {}
+            position = [self.columns[i] for i in key]
+            for row in self.rows:
+                index.setdefault(tuple(row.values[i] for i in position), []).append(row)
+            self.row_index[key] = index
+        return index
+
+    def lookup(self, key: tuple, value) -> list:
+        if self.pack is not None:
+            return self.pack.lookup(key, value)
+        return self.get_index(key).get(tuple(value))
+
+    def search(self, key: tuple, value, alternative_value_list=None):
+        ret = self.lookup(key, value)
+        if ret is None and alternative_value_list is not None:
+            for i in alternative_value_list:
+                ret = self.lookup(key, i)
+                if ret is not None:
+                    break
+        return ret
+
+    def fetch_all(self, key, value, alternative_value_list=None) -> list:
         '''
-            获取某条数据.
+            获取符合条件的所有数据, 返回 TabRow 的列表. 找不到时返回 None.
+            - `key` : 列名, 或列名的列表 (如 ['ID', 'Level']).
+            - `value` : 与 key 对应的值.
+            - `alternative_value_list` : 找不到数据时依次尝试的备选值.
         '''
         if type(key) == str:
             key = [key]
             value = [value]
-        for i in key:
-            if i not in self.index:
-                if not self.data_index_changed:
-                    self.df = self.df.set_index(i, drop=False)
-                    self.data_index_changed = True
-                else:
-                    self.df = self.df.set_index(i, append=True, drop=False)
-                self.index.append(i)
-        # search = [value[key.index(x)] if x in key else slice(None) for x in self.index]
-        search = tuple(value[key.index(x)] if x in key else slice(None) for x in self.index)
-        # df_ret = self.df.loc[search]
-        try:  # 尝试直接在 data 包的 buff.tab 对应的数据中获取.
-            return self.df.loc[search]
-        except:
-            if alternative_value_list is not None:
-                for i in alternative_value_list:
-                    search_alternative = tuple(i[key.index(x)] if x in key else slice(None) for x in self.index)
-                    try:
-                        return self.df.loc[search_alternative]
-                    except:
-                        pass
+        key = tuple(key)
+        if key not in self.keys:
+            self.keys.append(key)
+        ret = self.search(key, value, alternative_value_list)
+        if ret is not None:
+            return ret
         '''
             无法在 data 包中的数据中获取所需的数据. 转而去 pak 包中寻找.
             注意, 本段代码应当只在开发环境中被真正运行. 在生产环境中, 应当保证 data 包中包含所有要使用的数据.
@@ -99,33 +172,55 @@ class TabAttr():
                 self.pakdata_loaded = True  # 设置已加载标志, 防止再次加载.
             except:
                 raise RuntimeError(f'{self.path} loads failed, need pak file as data source.')
+        if self.pack is not None:  # 数据包中的数据不可修改, 转为使用 data 包中的二进制文件
+            self.load_data()
         # 将属性加载入 data 包的数据中. 注意, 仅对 key[0] 做检查 (例如, key 为 ['BuffID', 'BuffLevel'], 此时仅对第一项做检查)
+        import pandas as pd
         df_ret = self.df_pak.loc[self.df_pak[key[0]] == value[0]]
-        df_ret = df_ret.set_index(self.index, drop=False)
-        self.df = pd.concat([self.df, df_ret], axis=0).sort_index()
-        self.rows_added += len(df_ret)
+        if len(df_ret) > 0:
+            self.df = pd.concat([self.df, df_ret], axis=0, ignore_index=True)
+            self.rows_added += len(df_ret)
+            self.build_rows()
         print(f'Warning: Load data from {self.path}.')
-        try:  # 尝试直接在 data 包的 buff.tab 对应的数据中获取.
-            return self.df.loc[search]
-        except:
-            if alternative_value_list is not None:
-                for i in alternative_value_list:
-                    search_alternative = tuple(i[key.index(x)] if x in key else slice(None) for x in self.index)
-                    try:
-                        return self.df.loc[search_alternative]
-                    except:
-                        pass
+        return self.search(key, value, alternative_value_list)
+
+    def fetch(self, key, value, alternative_value_list=None) -> TabRow:
+        '''
+            获取某条数据, 返回 TabRow. 若有多条数据符合条件, 返回第一条; 找不到时返回 None.
+        '''
+        ret = self.fetch_all(key, value, alternative_value_list)
+        return ret[0] if ret is not None else None
 
     @classmethod
     def save_data(cls):
         '''
             将数据保存至 data 包. 同样, 本方法应当只在开发环境中被确实调用. 注意, 该方法不应当通过实例化的对象调用, 而是应当直接通过类调用.
+            仅在有数据更新时重新生成数据包. 数据包不存在 (或已过期) 时, 可以直接调用 build_pack 生成.
         '''
+        rebuild = False
         for i in cls.instance:
             i: TabAttr
             if i.rows_added > 0:
-                with open(f'data/{i.path.stem}{i.path.suffix[1:]}.bin', 'wb') as f:
+                with open(f'data/{i.name}.bin', 'wb') as f:
                     pickle.dump(i.df, f)
                 print(f'Add {i.rows_added} rows in {i.path}.')
+                i.rows_added = 0
+                rebuild = True
             # else:
             #     print(f'{i.path} is not used.')
+        if rebuild:
+            cls.build_pack()
+
+    @classmethod
+    def build_pack(cls):
+        '''将所有表编译为数据包, 见 src.frame.datapack.DataPack. 生成后各表改为从新的数据包中读取.'''
+        table_list = []
+        for i in cls.instance:
+            i: TabAttr
+            if not i.data_loaded:
+                i.load_data()
+            table_list.append((i.name, i.df, i.keys, Path(f'data/{i.name}.bin')))
+        DataPack.build(table_list)
+        for i in cls.instance:
+            i.pack = DataPack.table(i.name, Path(f'data/{i.name}.bin'))
+        print(f'Build data pack {DataPack.path}.')
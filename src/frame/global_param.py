@@ -2,6 +2,23 @@
 import json
 
 
+def level_cof(level):  # 等级系数的计算公式
+    res = 0
+    if level <= 15:
+        res = 50
+    elif 15 < level and level <= 90:
+        res = 4 * level - 10
+    elif 90 < level and level <= 95:
+        res = 85 * (level - 90) + 350
+    elif 95 < level and level <= 100:
+        res = 185 * (level - 95) + 775
+    elif 100 < level and level <= 110:
+        res = 205 * (level - 100) + 1700
+    elif 110 < level and level <= 130:
+        res = 450 * (level - 110) + 3750
+    return res
+
+
 class GlobalParam():
     '''
         GlobalParam 类用于调用全局变量. 注意, 该类不应被实例化.
@@ -12,21 +29,13 @@ class GlobalParam():
     except:
         raise RuntimeError('data/GlobalParam.json loads failed.')
 
+    cof_dict = {i: level_cof(i) for i in range(131)}  # 预先计算的各等级的等级系数
+
     @classmethod
     def Cof(cls, level):  # 等级系数
-        res = 0
-        if level <= 15:
-            res = 50
-        elif 15 < level and level <= 90:
-            res = 4 * level - 10
-        elif 90 < level and level <= 95:
-            res = 85 * (level - 90) + 350
-        elif 95 < level and level <= 100:
-            res = 185 * (level - 95) + 775
-        elif 100 < level and level <= 110:
-            res = 205 * (level - 100) + 1700
-        elif 110 < level and level <= 130:
-            res = 450 * (level - 110) + 3750
+        res = cls.cof_dict.get(level)
+        if res is None:
+            res = level_cof(level)
         return res
 
     @classmethod
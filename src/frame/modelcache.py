@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from pathlib import Path
+from src.frame.datapack import DataPack
+from src.frame.modelformat import ModelReader, ModelWriter
+from src.frame.script import Script
+import hashlib
+import json
+import os
+
+
+class ModelCache():
+    '''
+        ModelCache 类为模型 (src.frame.damage.Damage.export_model 的返回值) 的缓存. 注意, 该类不应被实例化.
+
+        缓存以内容寻址: 键为战斗设置 (fight), 数据包版本与脚本版本的规范化 json 的 sha256, 因此语义相同的请求共用同一个模型, 而表或脚本变化后旧模型自然失效.
+        模型以二进制格式 (见 src.frame.modelformat) 存放在 data/cache/<键>.model 中, 磁盘上的总大小超过 max_bytes 时按最近使用时间 (文件的 mtime, 命中时更新) 淘汰.
+        回放时模型文件被映射至内存 (见 open), 同时回放同一模型的各进程共用操作系统的页缓存, 而不必各自读取并反序列化整个模型.
+    '''
+    VERSION = 2  # 模型格式版本. 模型格式变化时自增, 使旧模型失效.
+    path = Path('data/cache')
+    suffix = '.model'
+    max_bytes = 256 * 2**20
+    index = None  # 文件名 -> 文件大小, 按最近使用时间排列 (最久未使用的在前)
+    index_mtime = None  # 建立 index 时缓存目录的 st_mtime_ns
+    hits = 0
+    misses = 0
+
+    @classmethod
+    def key(cls, fight: dict) -> str:
+        '''计算缓存键.'''
+        content = {
+            'version': cls.VERSION,
+            'fight': fight,
+            'data': cls.data_version(),
+            'scripts': cls.scripts_version(),
+        }
+        s = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def data_version():
+        '''
+            数据的版本. 由数据的内容 (而非文件的修改时间) 决定, 因此重新生成内容相同的数据包不会使模型失效.
+            为数据包的内容版本 (见 DataPack.content_version). 数据包不可用时为 data 中各表文件的 [文件名, sha256].
+        '''
+        ret = DataPack.content_version()
+        if ret is not None:
+            return ret
+        return sorted([i.name, DataPack.file_digest(i)] for i in Path('data').glob('*.bin'))
+
+    @staticmethod
+    def scripts_version() -> list:
+        '''脚本的版本. 开发环境中为各脚本文件的 [文件名, st_mtime_ns, st_size], 生产环境中为脚本清单.'''
+        if Script.scripts_dir.is_dir():
+            return sorted([i.name, *DataPack.source_stat(i)] for i in Script.scripts_dir.glob('*.py'))
+        return Script.load_manifest()
+
+    @staticmethod
+    def dumps(model: list) -> bytes:
+        return ModelWriter.encode(model)
+
+    @staticmethod
+    def loads(data) -> ModelReader:
+        return ModelReader(data)
+
+    @classmethod
+    def load_index(cls, force=False):
+        '''
+            扫描缓存目录, 建立 index. 服务进程与各 worker 都会保存与淘汰模型, 因此目录的 mtime 变化 (有进程新增或删除了模型) 时重新扫描.
+            - `force` : 总是重新扫描. 其他进程命中模型时只更新文件的 mtime 而不改变目录的 mtime, 淘汰前需要重新扫描以得到准确的最近使用时间.
+        '''
+        try:
+            mtime = os.stat(cls.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if cls.index is not None and not force and mtime == cls.index_mtime:
+            return
+        cls.index = OrderedDict()
+        cls.index_mtime = mtime
+        if mtime is None:
+            return
+        entries = []
+        try:
+            for i in os.scandir(cls.path):
+                if i.name.endswith(cls.suffix):
+                    try:
+                        st = i.stat()
+                    except OSError:  # 已被其他进程淘汰
+                        continue
+                    entries.append((st.st_mtime_ns, i.name, st.st_size))
+        except OSError:
+            return
+        for _, name, size in sorted(entries):
+            cls.index[name] = size
+
+    @classmethod
+    def get(cls, key: str, count=True) -> Path:
+        '''
+            获取模型文件的路径. 不存在时返回 None.
+            - `count` : 是否计入命中统计.
+        '''
+        cls.load_index()
+        name = key + cls.suffix
+        ret = cls.path / name
+        try:
+            os.utime(ret)  # 更新最近使用时间
+            cls.index[name] = ret.stat().st_size
+            cls.index.move_to_end(name)
+        except OSError:
+            cls.index.pop(name, None)
+            ret = None
+        if count:
+            if ret is not None:
+                cls.hits += 1
+            else:
+                cls.misses += 1
+        return ret
+
+    @classmethod
+    def open(cls, key: str) -> ModelReader:
+        '''以内存映射的方式打开模型, 用毕应调用其 close 方法. 不存在时返回 None.'''
+        path = cls.get(key, count=False)
+        if path is None:
+            return None
+        return ModelReader.open(path)
+
+    @classmethod
+    def put(cls, key: str, model: list):
+        '''保存模型.'''
+        data = cls.dumps(model)
+        cls.path.mkdir(parents=True, exist_ok=True)
+        name = key + cls.suffix
+        tmp = cls.path / f'{name}.tmp{os.getpid()}'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        try:
+            os.replace(tmp, cls.path / name)
+        except OSError:  # 同名模型正被映射 (Windows 下无法替换), 保留原文件
+            os.remove(tmp)
+        cls.evict(name)
+
+    @classmethod
+    def evict(cls, keep: str = None):
+        '''
+            淘汰最久未使用的模型, 直至磁盘上 (所有进程保存) 的总大小不超过 max_bytes.
+            - `keep` : 总是保留的模型文件名, 即刚保存的模型.
+        '''
+        cls.load_index(force=True)
+        if keep in cls.index:
+            cls.index.move_to_end(keep)
+        total = sum(cls.index.values())
+        while total > cls.max_bytes and len(cls.index) > 1:
+            name, size = cls.index.popitem(last=False)
+            total -= size
+            try:
+                os.remove(cls.path / name)
+            except OSError:
+                pass
+
+    @classmethod
+    def stat(cls) -> dict:
+        cls.load_index()
+        return {
+            'hits': cls.hits,
+            'misses': cls.misses,
+            'count': len(cls.index),
+            'bytes': sum(cls.index.values()),
+        }
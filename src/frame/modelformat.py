@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import mmap
+import pickle
+import struct
+
+
+'''
+    模型 (src.frame.damage.Damage.model_list) 的二进制格式. 由 ModelWriter 编码, 由 ModelReader 流式解码.
+
+    文件由三部分组成: 魔数 (4 字节), 文件头长度 (4 字节, 小端) 与文件头, 以及记录区.
+    文件头为 (属性名表, 常量表, 记录数, 最后一条记录的 tick) 的 pickle.
+    记录区中的每条记录依次为:
+    - 操作类型 (1 字节): SOURCE (damagecalc_source) 或 LAST (damagecalc_last).
+    - 与上一条记录的 tick 之差 (varint).
+    - 自身与目标的属性变化 (见 Attribute.export_stat_change): 条数 (varint), 以及每条的属性名 id (varint) 和值.
+      值为整数时编码为 zigzag varint 左移一位, 否则为常量 id 左移一位再加一.
+    - SOURCE 记录: 参数元组 (SkillID, Level, ..., channel_interval_cof) 的常量 id (varint). 同一技能的参数元组通常相同, 因此只在常量表中保存一次.
+    - LAST 记录: 所引用的 SOURCE 记录的序号, 以与最新一条 SOURCE 记录的距离表示 (varint), 代替 HashID 字符串.
+'''
+
+
+def typed_key(value):
+    '''常量表的键. 与 value 本身不同, 1, 1.0 与 True 对应不同的键.'''
+    if type(value) == tuple:
+        return tuple(typed_key(i) for i in value)
+    return (type(value), value)
+
+
+class ModelWriter():
+    '''
+        ModelWriter 类用于将模型编码为二进制格式.
+
+        for example:
+        ```python
+            data = ModelWriter.encode(Damage.model_list)
+        ```
+    '''
+    MAGIC = b'JXM\x01'
+    SOURCE = 0
+    LAST = 1
+
+    def __init__(self) -> None:
+        self.names = []  # 属性名表
+        self.name_id = {}
+        self.constants = []  # 常量表
+        self.constant_id = {}
+        self.buffer = bytearray()
+        self.tick = 0
+        self.count = 0
+        self.source_count = 0
+        self.source_id = {}  # HashID -> SOURCE 记录的序号. HashID 相同时以最新的记录为准 (与旧格式相同).
+
+    @classmethod
+    def encode(cls, model_list: list) -> bytes:
+        writer = cls()
+        for record in model_list:
+            writer.append(record)
+        return writer.dumps()
+
+    def varint(self, value: int):
+        buffer = self.buffer
+        while value > 0x7f:
+            buffer.append((value & 0x7f) | 0x80)
+            value >>= 7
+        buffer.append(value)
+
+    def intern_constant(self, value) -> int:
+        key = typed_key(value)
+        ret = self.constant_id.get(key)
+        if ret is None:
+            ret = self.constant_id[key] = len(self.constants)
+            self.constants.append(value)
+        return ret
+
+    def write_stat(self, stat: dict):
+        self.varint(len(stat))
+        for name, value in stat.items():
+            name_id = self.name_id.get(name)
+            if name_id is None:
+                name_id = self.name_id[name] = len(self.names)
+                self.names.append(name)
+            self.varint(name_id)
+            if type(value) == int:
+                self.varint(((value << 1) if value >= 0 else ((-value << 1) - 1)) << 1)
+            else:
+                self.varint((self.intern_constant(value) << 1) | 1)
+
+    def append(self, record: tuple):
+        t, tick, (selfattr_data, targetattr_data), other = record
+        op = self.SOURCE if 'damagecalc_source' == t else self.LAST
+        self.buffer.append(op)
+        self.varint(tick - self.tick)
+        self.tick = tick
+        self.write_stat(selfattr_data)
+        self.write_stat(targetattr_data)
+        if self.SOURCE == op:
+            self.varint(self.intern_constant(other))
+            self.source_id[f'{tick}_{other[0]}_{other[1]}'] = self.source_count  # 与 Damage.damagecalc_source 中的 HashID 相同
+            self.source_count += 1
+        else:
+            self.varint(self.source_count - 1 - self.source_id[other])
+        self.count += 1
+
+    def dumps(self) -> bytes:
+        header = pickle.dumps((self.names, self.constants, self.count, self.tick), protocol=pickle.HIGHEST_PROTOCOL)
+        return b''.join((self.MAGIC, struct.pack('<I', len(header)), header, self.buffer))
+
+
+class ModelReader():
+    '''
+        ModelReader 类用于流式解码二进制格式的模型. 数据可以是 bytes 或 mmap: 以 open 打开文件时, 文件被映射至内存, 同时回放同一模型的各进程共用一份数据.
+        迭代时依次返回 (操作类型, tick, 自身属性变化, 目标属性变化, 参数), 其中 LAST 记录的参数为所引用的 SOURCE 记录的序号 (从 0 开始).
+    '''
+    SOURCE = ModelWriter.SOURCE
+    LAST = ModelWriter.LAST
+
+    def __init__(self, data) -> None:
+        if data[:4] != ModelWriter.MAGIC:
+            raise RuntimeError('Unsupported model format.')
+        header_size, = struct.unpack('<I', data[4:8])
+        self.names, self.constants, self.count, self.duration = pickle.loads(data[8:8 + header_size])  # duration 为最后一条记录的 tick
+        self.data = data
+        self.begin = 8 + header_size
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        data = self.data
+        names = self.names
+        constants = self.constants
+        pos = self.begin
+        end = len(data)
+        tick = 0
+        source_count = 0
+
+        def varint():
+            nonlocal pos
+            ret = 0
+            shift = 0
+            while True:
+                b = data[pos]
+                pos += 1
+                ret |= (b & 0x7f) << shift
+                if b < 0x80:
+                    return ret
+                shift += 7
+
+        def stat() -> dict:
+            ret = {}
+            for _ in range(varint()):
+                name = names[varint()]
+                value = varint()
+                if value & 1:
+                    ret[name] = constants[value >> 1]
+                else:
+                    value >>= 1
+                    ret[name] = (value >> 1) if not value & 1 else -((value + 1) >> 1)
+            return ret
+
+        while pos < end:
+            op = data[pos]
+            pos += 1
+            tick += varint()
+            selfattr_data = stat()
+            targetattr_data = stat()
+            if self.SOURCE == op:
+                other = constants[varint()]
+                source_count += 1
+            else:
+                other = source_count - 1 - varint()
+            yield op, tick, selfattr_data, targetattr_data, other
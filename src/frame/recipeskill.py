@@ -1,37 +1,86 @@
 # -*- coding: utf-8 -*-
-import pandas as pd
-from src.frame.fetchdata import TabAttr
+from src.frame.fetchdata import TabAttr, TabRow
 
 
 class RecipeSkill():
     '''
         RecipeSkill 类用于存放某个对象的秘籍并实现相关功能, 可以通俗地理解为秘籍列表.
+
+        秘籍按 SkillID 和 SkillRecipeType 建立索引. 每个技能的秘籍效果汇总 (见 get_effect) 会被缓存, 在 add 或 forget 使版本号变化后才重新计算.
     '''
-    tabattr = TabAttr('settings/skill/recipeSkill.tab')
+    tabattr = TabAttr('settings/skill/recipeSkill.tab', keys=[('RecipeID',), ('RecipeID', 'RecipeLevel')])
 
     def __init__(self) -> None:
-        # self.df = None  # 初始化, 用于存放当前对象的所有已激活秘籍
-        self.df = self.__class__.tabattr.fetch('RecipeID', 0).to_frame().T
-        self.forget(0)
-        pass
+        self.table = {}  # (RecipeID, RecipeLevel) -> 秘籍属性
+        self.by_skill = {}  # SkillID -> {(RecipeID, RecipeLevel): 秘籍属性}
+        self.by_type = {}  # SkillRecipeType -> {(RecipeID, RecipeLevel): 秘籍属性}
+        self.version = 0  # 每次 add 或 forget 时自增
+        self.effect = {}  # (SkillID, RecipeType) -> (版本号, 秘籍效果汇总)
 
     def add(self, RecipeID, RecipeLevel=1):
+        if (RecipeID, RecipeLevel) in self.table:
+            return
         # 获取秘籍属性
         talent_attr = self.__class__.tabattr.fetch(['RecipeID', 'RecipeLevel'], [RecipeID, RecipeLevel])
-        self.df = pd.concat([self.df, talent_attr.to_frame().T], axis=0)
+        key = (RecipeID, RecipeLevel)
+        self.table[key] = talent_attr
+        if talent_attr['SkillID'] is not None:
+            self.by_skill.setdefault(talent_attr['SkillID'], {})[key] = talent_attr
+        if talent_attr['SkillRecipeType']:  # 0 与空值均不参与按类型匹配
+            self.by_type.setdefault(talent_attr['SkillRecipeType'], {})[key] = talent_attr
+        self.version += 1
 
     def forget(self, RecipeID, RecipeLevel=1):
-        '''取消秘籍.'''
-        self.df = self.df[self.df['RecipeID'] != RecipeID]
+        '''取消秘籍. 注意, 会取消该秘籍的所有等级.'''
+        for key in [i for i in self.table if i[0] == RecipeID]:
+            talent_attr = self.table.pop(key)
+            self.discard(self.by_skill, talent_attr['SkillID'], key)
+            self.discard(self.by_type, talent_attr['SkillRecipeType'], key)
+            self.version += 1
+
+    @staticmethod
+    def discard(index: dict, value, key):
+        group = index.get(value)
+        if group is not None:
+            group.pop(key, None)
+            if len(group) == 0:
+                index.pop(value)
 
     def is_exist(self, RecipeID, RecipeLevel=1):
-        return self.df.index.isin([(RecipeID, RecipeLevel)]).any()
+        return (RecipeID, RecipeLevel) in self.table
+
+    def get_by_SkillID(self, SkillID) -> list:
+        return list(self.by_skill.get(SkillID, {}).values())
 
-    def get_by_SkillID(self, SkillID) -> pd.DataFrame:
-        return self.df[self.df['SkillID'] == SkillID]
+    def get_by_SkillRecipeType(self, SkillRecipeType) -> list:
+        return list(self.by_type.get(SkillRecipeType, {}).values())
 
-    def get_by_SkillRecipeType(self, SkillRecipeType) -> pd.DataFrame:
-        ret = self.df
-        ret = ret[ret['SkillRecipeType'] != 0]
-        ret = ret[ret['SkillRecipeType'] == SkillRecipeType]
+    def get_effect(self, SkillID, RecipeType=None) -> dict:
+        '''
+            获取对技能生效的秘籍效果汇总. 对技能生效的秘籍包括 SkillID 匹配的秘籍, 以及 SkillRecipeType 与技能的 RecipeType 匹配的秘籍.
+            返回值中 'CoolDownAdd1' ~ 'CoolDownAdd3' 与 'DamageAddPercent' 为各秘籍之和, 'ScriptFile' 为各秘籍的脚本列表.
+        '''
+        key = (SkillID, RecipeType)
+        cache = self.effect.get(key)
+        if cache is not None and cache[0] == self.version:
+            return cache[1]
+        recipe = dict(self.by_skill.get(SkillID, {}))
+        if RecipeType is not None:
+            for k, v in self.by_type.get(RecipeType, {}).items():
+                recipe.setdefault(k, v)
+        ret = {
+            'CoolDownAdd1': 0,
+            'CoolDownAdd2': 0,
+            'CoolDownAdd3': 0,
+            'DamageAddPercent': 0,
+            'ScriptFile': [],
+        }
+        for row in recipe.values():
+            row: TabRow
+            for name in ('CoolDownAdd1', 'CoolDownAdd2', 'CoolDownAdd3', 'DamageAddPercent'):
+                if row[name] is not None:
+                    ret[name] += int(row[name])
+            if row['ScriptFile'] is not None:
+                ret['ScriptFile'].append(row['ScriptFile'])
+        self.effect[key] = (self.version, ret)
         return ret
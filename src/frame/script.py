@@ -1,51 +1,151 @@
 # -*- coding: utf-8 -*-
 import importlib
+import json
+import os
 import sys
 from pathlib import Path
 
 
+class ScriptEntry():
+    '''
+        ScriptEntry 类为脚本模块类的调度项, 存放其 cast, apply, unapply, on_remove 方法. 脚本模块类中不存在的方法在调用时抛出异常.
+    '''
+    __slots__ = ('name', 'modulecls', 'cast', 'apply', 'unapply', 'on_remove')
+
+    def __init__(self, name: str, modulecls) -> None:
+        self.name = name
+        self.modulecls = modulecls
+        for method in ('cast', 'apply', 'unapply', 'on_remove'):
+            func = getattr(modulecls, method, None)
+            if func is None:
+                func = self.missing(name, method)
+            setattr(self, method, func)
+
+    @staticmethod
+    def missing(name: str, method: str):
+        def func(*args, **kwargs):
+            raise RuntimeError(f'Script {name} has no method {method}.')
+        return func
+
+
 class Script():
+    '''
+        Script 类用于调用脚本. 注意, 该类不应被实例化.
+
+        worker 启动时由 load 读取脚本清单 (data/scripts.json, 由服务进程通过 build_manifest 生成) 并建立注册表 (脚本名 -> 脚本模块类). 脚本模块在第一次被调用时才导入.
+        每个 ScriptFile 路径只在第一次调用时解析, 解析结果存入调度表 (路径 -> ScriptEntry). 注册表中不存在的脚本会立即报错.
+    '''
+    manifest_path = 'data/scripts.json'
+    scripts_dir = Path('src/scripts')
+    registry = None  # 脚本名 -> 脚本模块类. 尚未导入的脚本为 None.
+    dispatch = {}  # ScriptFile 路径 -> ScriptEntry
+
     @classmethod
-    def get_moudle(cls, path: str):
+    def load(cls):
+        '''根据脚本清单建立注册表, 并清空调度表. 已导入的脚本模块直接加入注册表.'''
+        cls.registry = dict.fromkeys(cls.load_manifest())
+        cls.dispatch = {}
+        for modulepath, moudle in list(sys.modules.items()):
+            if modulepath.startswith('src.scripts.'):
+                name = modulepath[len('src.scripts.'):]
+                modulecls = getattr(moudle, name, None)
+                if modulecls is not None:
+                    cls.registry[name] = modulecls
+
+    @classmethod
+    def load_manifest(cls) -> list:
+        '''
+            读取脚本清单, 返回脚本名的列表. 本方法只读取, 不写入清单.
+            在开发环境中 (存在 src/scripts 目录), 直接列出目录中的脚本; 在生产环境中, 使用清单.
+        '''
+        if cls.scripts_dir.is_dir():
+            return cls.scan()
+        try:
+            with open(cls.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)['scripts']
+        except (OSError, ValueError, KeyError) as e:
+            print(f'Warning: Load script manifest {cls.manifest_path} failed: {e!r}.')
+            return []
+
+    @classmethod
+    def scan(cls) -> list:
+        return sorted(entry.name[:-3] for entry in os.scandir(cls.scripts_dir) if entry.is_file() and entry.name.endswith('.py') and entry.name not in ('__init__.py', 'base.py'))
+
+    @classmethod
+    def build_manifest(cls):
+        '''
+            在开发环境中生成脚本清单, 供生产环境使用. 本方法应当只在服务进程中 (启动子进程前) 调用一次, 子进程只读取清单.
+            清单未变化时不写入.
+        '''
+        if not cls.scripts_dir.is_dir():
+            return
+        manifest = {'scripts': cls.scan()}
+        try:
+            with open(cls.manifest_path, 'r', encoding='utf-8') as f:
+                if json.load(f) == manifest:
+                    return
+        except (OSError, ValueError):
+            pass
+        tmp = f'{cls.manifest_path}.tmp{os.getpid()}'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(tmp, cls.manifest_path)
+        except OSError as e:
+            print(f'Warning: Write script manifest {cls.manifest_path} failed: {e!r}.')
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    @classmethod
+    def get_entry(cls, path: str) -> ScriptEntry:
+        entry = cls.dispatch.get(path)
+        if entry is None:
+            entry = cls.dispatch[path] = cls.resolve(path)
+        return entry
+
+    @classmethod
+    def resolve(cls, path: str) -> ScriptEntry:
+        if cls.registry is None:
+            cls.load()
         # 对传入的路径字符串进行处理
         path = path.replace('%', '')
         name = path[max(path.rfind('/'), path.rfind('\\'))+1:path.rfind('.')]
-        # 获取模块
         modulepath = 'src.scripts.' + name
-        if modulepath in sys.modules:  # 如果模块存在
-            moudle = sys.modules[modulepath]
-        elif Path('src/scripts').exists() and Path('src/scripts').is_dir():  # 如果模块不存在, 且当前处于开发环境中
+        if name in cls.registry or modulepath in sys.modules:
+            modulecls = cls.registry.get(name)
+            if modulecls is None:  # 第一次调用, 导入脚本模块
+                modulecls = cls.registry[name] = getattr(importlib.import_module(modulepath), name)
+            return ScriptEntry(name, modulecls)
+        elif cls.scripts_dir.exists() and cls.scripts_dir.is_dir():  # 如果模块不存在, 且当前处于开发环境中
             with open(Path('src/scripts/' + name + '.py'), 'x', encoding='utf-8') as f:
                 s = f'# -*- coding: utf-8 -*-\nfrom src.character.player import player\nfrom src.scripts.base import ScriptBase\n\n\nclass {name}():\n    @classmethod\n    def cast(cls, skill, *args, **kwargs):\n        ret = None\n        dwSkillLevel = skill[\'Level\']\n        return ret'
                 f.write(s)
             raise RuntimeError(f'Script file not found: {name}')
         else:  # 否则
-            # moudle = importlib.import_module(modulepath)
-            raise RuntimeError('Module not exist.')
-        # 执行模块类中的 cast 函数
-        modulecls = getattr(moudle, name)
-        return modulecls
+            raise RuntimeError('Module not exist.', name)
+
+    @classmethod
+    def get_moudle(cls, path: str):
+        return cls.get_entry(path).modulecls
 
     @classmethod
     def execute(cls, path: str, skill, *args, **kwargs):
         '''执行脚本. 传入的参数应当原封不动传递给脚本模块类中的 cast 方法. 返回值原封不动返回给调用本方法的函数.'''
-        modulecls = cls.get_moudle(path)
-        return modulecls.cast(skill, *args, **kwargs)
+        return cls.get_entry(path).cast(skill, *args, **kwargs)
 
     @classmethod
     def apply(cls, path: str, *args, **kwargs):
         '''执行脚本的 apply 方法. 传入的参数应当原封不动传递给脚本模块类中的 apply 方法.'''
-        modulecls = cls.get_moudle(path)
-        return modulecls.apply(*args, **kwargs)
+        return cls.get_entry(path).apply(*args, **kwargs)
 
     @classmethod
     def unapply(cls, path: str, *args, **kwargs):
         '''执行脚本的 unapply 方法. 传入的参数应当原封不动传递给脚本模块类中的 unapply 方法.'''
-        modulecls = cls.get_moudle(path)
-        return modulecls.unapply(*args, **kwargs)
+        return cls.get_entry(path).unapply(*args, **kwargs)
 
     @classmethod
     def on_remove(cls, path: str, *args, **kwargs):
         '''执行脚本的 on_remove 方法. 传入的参数应当原封不动传递给脚本模块类中的 on_remove 方法.'''
-        modulecls = cls.get_moudle(path)
-        return modulecls.on_remove(*args, **kwargs)
+        return cls.get_entry(path).on_remove(*args, **kwargs)
@@ -1,37 +1,93 @@
 # -*- coding: utf-8 -*-
-import pandas as pd
 from src.frame.fetchdata import TabAttr
 
 
 class SkillEvent():
     '''
         SkillEvent 类用于存放某个对象的技能触发事件并实现相关功能, 可以通俗地理解为触发类事件列表.
+
+        触发事件按 EventSkillID 和 EventMask1/EventMask2 的每一位建立索引, 在 add 和 forget 时增量更新. 施展技能时通过 get_trigger 查询.
     '''
-    tabattr = TabAttr('settings/skill/SkillEvent.tab')
+    tabattr = TabAttr('settings/skill/SkillEvent.tab', keys=[('ID',)])
 
     def __init__(self) -> None:
-        # self.df = None  # 初始化, 用于存放当前对象的所有技能触发事件
-        self.df = self.__class__.tabattr.fetch('ID', 0).to_frame().T
-        self.forget(0)
-        pass
+        self.table = {}  # ID -> 触发事件, 见 self.add
+        self.seq = 0  # 添加序号, 用于保持触发顺序与添加顺序一致
+        self.by_skill = {}  # EventSkillID -> {ID: 触发事件}
+        self.by_mask1 = {}  # EventMask1 的某一位 -> {ID: 触发事件}
+        self.by_mask2 = {}  # EventMask2 的某一位 -> {ID: 触发事件}
+        self.version = 0  # 每次 add 或 forget 时自增
+
+    @staticmethod
+    def mask_bits(mask):
+        '''将 32 位掩码拆分为各个位.'''
+        mask = int(mask) & 0xffffffff if mask is not None else 0
+        while mask:
+            bit = mask & -mask
+            yield bit
+            mask ^= bit
 
     def add(self, ID):
+        if ID in self.table:
+            return
         # 获取技能触发事件属性
         skillevent_attr = self.__class__.tabattr.fetch('ID', ID)
-        self.df = pd.concat([self.df, skillevent_attr.to_frame().T], axis=0)
+        trigger = (self.seq, skillevent_attr['EventType'], skillevent_attr['SkillID'], skillevent_attr['SkillLevel'], skillevent_attr['Odds'])
+        self.seq += 1
+        self.table[ID] = (trigger, skillevent_attr)
+        if skillevent_attr['EventSkillID'] is not None:
+            self.by_skill.setdefault(skillevent_attr['EventSkillID'], {})[ID] = trigger
+        for bit in self.mask_bits(skillevent_attr['EventMask1']):
+            self.by_mask1.setdefault(bit, {})[ID] = trigger
+        for bit in self.mask_bits(skillevent_attr['EventMask2']):
+            self.by_mask2.setdefault(bit, {})[ID] = trigger
+        self.version += 1
 
     def forget(self, ID):
         '''取消技能触发事件.'''
-        self.df = self.df[self.df['ID'] != ID]
+        if ID not in self.table:
+            return
+        _, skillevent_attr = self.table.pop(ID)
+        self.discard(self.by_skill, skillevent_attr['EventSkillID'], ID)
+        for bit in self.mask_bits(skillevent_attr['EventMask1']):
+            self.discard(self.by_mask1, bit, ID)
+        for bit in self.mask_bits(skillevent_attr['EventMask2']):
+            self.discard(self.by_mask2, bit, ID)
+        self.version += 1
 
-    def is_exist(self, ID):
-        return ID in self.df.index
+    @staticmethod
+    def discard(index: dict, key, ID):
+        group = index.get(key)
+        if group is not None:
+            group.pop(ID, None)
+            if len(group) == 0:
+                index.pop(key)
 
-    def get_by_EventSkillID(self, EventSkillID) -> pd.DataFrame:
-        return self.df[self.df['EventSkillID'] == EventSkillID]
+    def is_exist(self, ID):
+        return ID in self.table
 
-    def get_by_EventMask(self, EventMask1, EventMask2) -> pd.DataFrame:
-        return self.df[(self.df['EventMask1'] & EventMask1) | (self.df['EventMask2'] & EventMask2)]
+    def get_trigger(self, EventSkillID, EventMask1=0, EventMask2=0) -> dict:
+        '''
+            获取施展技能时会被触发的事件, 按 EventType (PreCast, Cast, Hit, CriticalStrike 等) 分组.
+            返回值形如 {EventType: [(order, SkillID, SkillLevel, Odds), ...]}. order 为触发顺序: 先是 EventSkillID 匹配的事件, 再是掩码匹配的事件, 各自按添加顺序排列.
+        '''
+        if len(self.table) == 0:
+            return {}
+        found_skill = self.by_skill.get(EventSkillID, {})
+        found_mask = {}
+        for index, mask in ((self.by_mask1, EventMask1), (self.by_mask2, EventMask2)):
+            if mask:
+                mask = int(mask) & 0xffffffff
+                for bit, group in index.items():
+                    if bit & mask:
+                        found_mask.update(group)
+        if len(found_skill) == 0 and len(found_mask) == 0:
+            return {}
+        trigger_list = sorted(found_skill.values()) + sorted(v for k, v in found_mask.items() if k not in found_skill)
+        ret = {}
+        for order, (_, EventType, SkillID, SkillLevel, Odds) in enumerate(trigger_list):
+            ret.setdefault(EventType, []).append((order, SkillID, SkillLevel, Odds))
+        return ret
 
 
 class RandomEvent():
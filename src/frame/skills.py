@@ -7,11 +7,18 @@ class Skill():
     '''
         Skill 类用于存放某个对象的技能并实现相关功能, 可以通俗地理解为技能列表.
     '''
-    tabattr = TabAttr('settings/skill/skills.tab')
+    tabattr = TabAttr('settings/skill/skills.tab', keys=[('SkillID',)])
     general_table = {}  # 初始化哈希表, 用于存放未学习的通用技能
 
     def __init__(self) -> None:
         self.table = {}  # 初始化哈希表, 用于存放当前对象的所有已学习技能
+        self.version = 0  # 每次 learn 或 forget 时自增
+        self.cd_version = 0  # 每次 set_cd 修改了 cd_list 时自增
+
+    @classmethod
+    def reset(cls):
+        '''清空通用技能表. 在常驻 worker 处理下一次计算前调用.'''
+        cls.general_table = {}
 
     def learn(self, SkillID, Level):
         # 获取技能属性
@@ -25,6 +32,7 @@ class Skill():
             'Level': Level,
             'cd_list': [0, 0, 0, 0],
         }
+        self.version += 1
 
     def cast(self, SkillID, Level=None, *args, **kwargs):
         '''
@@ -53,6 +61,7 @@ class Skill():
     def forget(self, SkillID):
         '''遗忘技能.'''
         self.table.pop(SkillID)
+        self.version += 1
 
     def is_exist(self, SkillID, Level=None):
         if None == Level:
@@ -88,40 +97,63 @@ class Skill():
 
     def set_cd(self, SkillID, ID, index=0):
         if SkillID in self.table:
-            self.table[SkillID]['cd_list'][index] = ID
+            cd_list = self.table[SkillID]['cd_list']
         elif SkillID in self.__class__.general_table:
-            self.__class__.general_table[SkillID]['cd_list'][index] = ID
+            cd_list = self.__class__.general_table[SkillID]['cd_list']
         else:
             raise RuntimeError('Need to learn skills before set cd.')
+        if cd_list[index] != ID:
+            cd_list[index] = ID
+            self.cd_version += 1
 
     def get_cd_list(self, SkillID):
         if SkillID in self.table:
             return self.table[SkillID]['cd_list']
 
 
+class CastPlan():
+    '''
+        CastPlan 类为技能的施展计划, 存放施展某一 (SkillID, Level) 时不变的信息, 由 Player.get_cast_plan 创建.
+        施展计划在技能, 秘籍或触发事件变化 (即 version 变化) 后失效.
+        blocked_until 记录技能因 CD 无法施展的截止 tick, 在此之前重复施展可以直接返回. 该记录在 CD 被缩短或 cd_list 被修改 (即 blocked_version 变化) 后失效.
+    '''
+    __slots__ = ('version', 'skill_attr', 'skill_dict', 'need_out_of_fight', 'skill_event', 'recipe', 'kindtype', 'blocked_until', 'blocked_version')
+
+    def __init__(self, version, skill_attr, skill_dict, skill_event, recipe) -> None:
+        self.version = version  # (技能, 秘籍, 触发事件) 的版本号
+        self.skill_attr = skill_attr
+        self.skill_dict = skill_dict
+        self.need_out_of_fight = 1 == skill_attr['NeedOutOfFight']
+        self.skill_event = skill_event  # 见 SkillEvent.get_trigger
+        self.recipe = recipe  # 见 RecipeSkill.get_effect
+        kindtype = skill_attr['KindType']
+        if kindtype is not None and 'Magic' in kindtype:
+            kindtype = kindtype[:-5]
+        self.kindtype = kindtype
+        self.blocked_until = 0
+        self.blocked_version = None  # (CoolDown.version, Skill.cd_version)
+
+
 class SkillEffectList():
     '''
-        SkillEffectQueue 类是技能效果的列表.
+        SkillEffectQueue 类是技能效果的列表. 技能效果按 SkillID 分组存放, pop 时只处理该技能的效果.
     '''
 
     def __init__(self) -> None:
-        self.effect = []  # 定义一个列表, 用于存放技能效果
+        self.effect = {}  # 定义一个哈希表, 用于存放技能效果. SkillID -> [(SkillID, Level, func, args, kwargs), ...]
 
     @property
     def empty(self):
         return len(self.effect) == 0
 
     def push(self, SkillID, Level, func, *args, **kwargs):
-        self.effect.append((SkillID, Level, func, args, kwargs))
+        self.effect.setdefault(SkillID, []).append((SkillID, Level, func, args, kwargs))
 
     def pop(self, SkillID, Level):
-        l = len(self.effect)
-        for i in range(l):
-            index = l - i - 1
-            s_SkillID, _, s_func, s_args, s_kwargs = self.effect[index]
-            if s_SkillID == SkillID:
+        effect = self.effect.pop(SkillID, None)
+        if effect is not None:
+            for _, _, s_func, s_args, s_kwargs in reversed(effect):
                 s_func(*s_args, **s_kwargs)
-                self.effect.pop(index)
 
     # def pop_by_func(self, SkillID, func):
     #     l = len(self.effect)
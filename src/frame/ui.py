@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import pandas as pd
 from src.frame.fetchdata import TabAttr
 
 
@@ -7,13 +6,13 @@ class SkillUI():
     '''
         SkillUI 类用于存放技能的 UI 信息. 由于功能不多, 使用单例模式.
     '''
-    tabattr = TabAttr('ui/Scheme/Case/skill.txt')
+    tabattr = TabAttr('ui/Scheme/Case/skill.txt', keys=[('SkillID', 'Level')])
 
     @classmethod
     def get_name(cls, SkillID, Level) -> str:
         ret = ''
         res = cls.tabattr.fetch(['SkillID', 'Level'], [SkillID, Level], alternative_value_list=[[SkillID, 0]])
-        if type(res) == pd.Series:
+        if res is not None:
             ret = res['Name']
         return ret
 
@@ -22,12 +21,30 @@ class BuffUI():
     '''
         BuffUI 类用于存放技能的 UI 信息. 由于功能不多, 使用单例模式.
     '''
-    tabattr = TabAttr('ui/Scheme/Case/buff.txt')
+    tabattr = TabAttr('ui/Scheme/Case/buff.txt', keys=[('BuffID', 'Level')])
 
     @classmethod
     def get_name(cls, BuffID, Level) -> str:
         ret = ''
         res = cls.tabattr.fetch(['BuffID', 'Level'], [BuffID, Level], alternative_value_list=[[BuffID, 0]])
-        if type(res) == pd.Series:
+        if res is not None:
             ret = res['Name']
         return ret
+
+
+class UIName():
+    '''
+        UIName 类用于解析伤害记录中的名称键. 伤害记录中只保存名称键, 在生成统计时才通过本类解析为 UI 名称.
+        - ('skill', SkillID, Level) : 技能名称, 见 SkillUI.
+        - ('buff', BuffID, Level) : buff 名称, 见 BuffUI.
+        - 其他值 (如旧模型中直接保存的字符串) 原样返回.
+    '''
+
+    @classmethod
+    def resolve(cls, name) -> str:
+        if type(name) == tuple:
+            if 'skill' == name[0]:
+                return SkillUI.get_name(name[1], name[2])
+            elif 'buff' == name[0]:
+                return BuffUI.get_name(name[1], name[2])
+        return name
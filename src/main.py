@@ -1,35 +1,35 @@
 # -*- coding: utf-8 -*-
-from pathlib import Path
 from typing import Union
 import asyncio
-import hashlib
 import json
 import multiprocessing
+import os
+import random
+import threading
 # import time
 import websockets.legacy.server as websockets
+from websockets.exceptions import ConnectionClosed
+from src.frame.damagering import DamageRing
+from src.frame.modelcache import ModelCache
+from src.frame.script import Script
 
 
 class Program():
-    def __init__(self, pipe=None) -> None:
-        scripts_dir = Path('./src/scripts')
-        process_init_filename = './src/worker_calc/__init__.py'
-        if scripts_dir.exists() and scripts_dir.is_dir():
-            with open(process_init_filename, 'w+', encoding='utf-8') as f:
-                f.write(f'# -*- coding: utf-8 -*-\n')
-                for path in scripts_dir.iterdir():
-                    if path.is_file() and path.suffix == '.py':
-                        module_name = path.stem
-                        f.write(f'import src.scripts.{module_name}\n')
-            # print('Init completely.')
+    '''
+        Kernel 的服务进程. 每个 websocket 连接对应一个会话 (Session), 各会话的请求由调度器 (Scheduler) 分配至共享的常驻子进程.
+        - `workers` : 用于计算与用于计算属性收益的常驻子进程各自的数量. 省略时与 CPU 核心数相同 (与 ProgramMonteCarlo 一致).
+    '''
+
+    def __init__(self, pipe=None, workers: int = None) -> None:
         self.pipe = pipe
+        self.workers = max(1, workers) if workers is not None else os.cpu_count() or 1
         self.stop_event = asyncio.Event()
 
     def main(self):
         # init
-        self.child_arg = self.arg_init()
         multiprocessing.freeze_support()
-        self.process_calc = ProgramChildCalc(self)
-        self.process_attrbenefit = ProgramChildAttrBenefit(self)
+        Script.build_manifest()  # 在启动子进程前生成脚本清单, 子进程只读取清单
+        self.scheduler = Scheduler(self.workers)
 
         loop = asyncio.get_event_loop()
         tasks = [
@@ -41,71 +41,32 @@ class Program():
         self.cleanup()
 
     def cleanup(self):
-        self.process_calc.cleanup()
-        self.process_attrbenefit.cleanup()
+        self.scheduler.cleanup()
 
     async def task_pipe(self):
-        while True:
-            if self.pipe is not None:
-                if self.pipe.poll():
-                    self.stop_event.set()
-                    break
-                await asyncio.sleep(1)
-            else:
-                await asyncio.Future()
+        '''父进程通过管道发送任意消息时停止服务. 管道由守护线程阻塞地等待, 而非轮询.'''
+        if self.pipe is None:
+            await asyncio.Future()
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        def wait():
+            try:
+                self.pipe.poll(None)
+            except (EOFError, OSError):
+                pass
+            loop.call_soon_threadsafe(done.set_result, None)
+
+        threading.Thread(target=wait, daemon=True).start()
+        await done
+        self.stop_event.set()
 
     async def server(self):
         async with websockets.serve(self.server_handle, "localhost", 8765):
             await self.stop_event.wait()
 
     async def server_handle(self, websocket: websockets.WebSocketServerProtocol):
-        self.websocket = websocket
-        # 接收数据
-        async for message in websocket:
-            try:
-                self.child_arg = json.loads(message)
-            except:
-                print('json.loads error.')
-                return
-            if not self.arg_check():
-                print('arg_check error.')
-                return
-
-            await self.send_message(category='data_begin')
-
-            cachename = hashlib.md5(json.dumps(self.child_arg['fight']).encode('utf-8')).hexdigest()
-            random_event_work = self.child_arg['fight']['random_event_work']
-            if not Path(f'data/cache/{cachename}').exists() or random_event_work:
-                # await websocket.send('模型不存在, 或是开启了随机事件, 正在重新建立模型.')
-                # start_time = time.time()
-                await self.worker_calc_handle()
-                # end_time = time.time()
-                # run_time = int((end_time - start_time) * 1000)
-                # await self.send_message(category='time_spent', data=run_time)
-            if Path(f'data/cache/{cachename}').exists():  # 如果还是不存在, 说明 worker_calc 运行出错, 此时不再运行 worker_attrbenefit
-                # start_time = time.time()
-                await self.worker_attrbenefit_handle()
-                # end_time = time.time()
-                # run_time = int((end_time - start_time) * 1000)
-                # await self.send_message(category='time_spent', data=run_time)
-
-            await self.send_message(category='data_end')
-
-    async def worker_calc_handle(self):
-        await self.process_calc.handle(self.child_arg)
-        self.process_calc.reset()
-
-    async def worker_attrbenefit_handle(self):
-        await self.process_attrbenefit.handle(self.child_arg)
-        self.process_attrbenefit.reset()
-
-    async def send_message(self, category: str, data: Union[None, dict] = None):
-        message = {
-            'category': category,
-        }
-        if data is not None:
-            message['data'] = data
-        await self.websocket.send(json.dumps(message, ensure_ascii=False))
+        await Session(self, websocket).serve()
 
     def arg_init(self) -> dict:
         ret = {
@@ -131,7 +92,7 @@ class Program():
         #     pass
         return ret
 
-    def arg_check(self) -> bool:
+    def arg_check(self, arg: dict) -> bool:
         standard = {
             'attr_self': {
                 "attr": '',
@@ -166,139 +127,497 @@ class Program():
                         ret = ret and check_dict(standard[key], obj[key])
             return ret
 
-        ret = check_dict(standard, self.child_arg)
+        ret = check_dict(standard, arg)
 
         # fight skill_list 额外检查
-        for i in self.child_arg['fight']['skill_list']:
-            if i not in self.child_arg['fight']['include']['lists']:
+        for i in arg['fight']['skill_list']:
+            if i not in arg['fight']['include']['lists']:
                 return False
 
         return ret
 
 
-def child_calc_entry(queue_put, queue_get):
-    '''子进程的入口函数. 不能放在子进程类中, 以避免子进程递归实例化子进程.'''
+class Session():
+    '''
+        Session 类为一个 websocket 连接. 同一连接的请求默认依次处理; 请求中包含 `id` 字段时, 该请求与同一连接的其他请求并发处理, 且其所有响应消息均带有相同的 `id` 字段.
+        连接断开后, 仍在处理的请求会继续处理完毕 (以免子进程的消息被之后的请求读取), 但不再发送消息.
+    '''
+
+    def __init__(self, program: Program, websocket: websockets.WebSocketServerProtocol) -> None:
+        self.program = program
+        self.websocket = websocket
+        self.closed = False
+        self.affinity = {}  # 子进程池 -> 本会话上次使用的子进程. 优先使用同一子进程, 以复用其检查点 (见 src.frame.checkpoint)
+
+    async def serve(self):
+        tasks = set()
+        # 接收数据
+        async for message in self.websocket:
+            try:
+                arg = json.loads(message)
+            except:
+                print('json.loads error.')
+                break
+            if not self.program.arg_check(arg):
+                print('arg_check error.')
+                break
+            job = Job(self, arg)
+            if job.id is None:
+                await self.program.scheduler.run(job)
+            else:
+                task = asyncio.create_task(self.program.scheduler.run(job))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if len(tasks) > 0:
+            await asyncio.wait(tasks)
+
+    async def send_message(self, message: dict):
+        if self.closed:
+            return
+        try:
+            await self.websocket.send(json.dumps(message, ensure_ascii=False))
+        except ConnectionClosed:
+            self.closed = True
+
+
+class Job():
+    '''Job 类为一次请求. 请求的所有响应消息都发送至发起请求的连接.'''
+
+    def __init__(self, session: Session, arg: dict) -> None:
+        self.session = session
+        self.arg = arg
+        self.id = arg.get('id')
+
+    async def send_message(self, category: str, data: Union[None, dict] = None):
+        message = {
+            'category': category,
+        }
+        if data is not None:
+            message['data'] = data
+        if self.id is not None:
+            message['id'] = self.id
+        await self.session.send_message(message)
+
+    async def send_damage_ring(self, ring: DamageRing, doorbell: tuple):
+        '''
+            读出门铃消息对应的伤害数据, 作为一条 damage_batch 消息发送 (见 DamageStream).
+            连接已断开时仍读出数据 (以推进读取序号), 但不再发送, 并设置放弃标志, 使子进程不再发送本次计算的伤害数据.
+        '''
+        _, start, count = doorbell
+        tick, except_damage = ring.read(start, count)
+        if self.session.closed:
+            ring.abort()
+            return
+        await self.send_message(category='damage_batch', data={'tick': tick, 'except': except_damage})
+
+
+class WorkerPool():
+    '''WorkerPool 类为一组同类的常驻子进程. 请求在其中任一空闲的子进程中处理, 没有空闲的子进程时按先来后到等待.'''
+
+    def __init__(self, factory, count: int) -> None:
+        self.workers = [factory() for _ in range(count)]
+        self.idle = list(self.workers)
+        self.condition = None  # 在第一次 acquire 时 (即事件循环中) 创建
+
+    async def acquire(self, preferred=None):
+        '''获取一个空闲的子进程. preferred 空闲时优先获取.'''
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        async with self.condition:
+            await self.condition.wait_for(lambda: len(self.idle) > 0)
+            worker = preferred if preferred in self.idle else self.idle[0]
+            self.idle.remove(worker)
+            return worker
+
+    async def release(self, worker):
+        async with self.condition:
+            self.idle.append(worker)
+            self.condition.notify()
+
+    async def handle(self, job: Job):
+        '''在空闲的子进程中处理请求. 子进程已退出时先重新启动.'''
+        worker = await self.acquire(job.session.affinity.get(self))
+        try:
+            worker.reset()
+            await worker.handle(job.arg, job)
+        finally:
+            worker.reset()
+            job.session.affinity[self] = worker
+            await self.release(worker)
+
+    def cleanup(self):
+        for worker in self.workers:
+            worker.cleanup()
+
+
+class Scheduler():
+    '''
+        Scheduler 类为请求的调度器. 所有会话共用同一组子进程池, 不同会话 (以及带有 `id` 的请求) 的计算并发进行.
+        多个请求同时需要建立同一模型时, 只有第一个请求进行计算, 其余请求等待其完成后直接使用模型.
+    '''
+
+    def __init__(self, workers: int) -> None:
+        self.pool_calc = WorkerPool(ProgramChildCalc, workers)
+        self.pool_attrbenefit = WorkerPool(ProgramChildAttrBenefit, workers)
+        self.process_montecarlo = ProgramMonteCarlo()
+        self.building = {}  # 模型的键 -> 正在建立该模型的请求完成时的 Future
+
+    def cleanup(self):
+        self.pool_calc.cleanup()
+        self.pool_attrbenefit.cleanup()
+        self.process_montecarlo.cleanup()
+
+    async def run(self, job: Job):
+        arg = job.arg
+        await job.send_message(category='data_begin')
+
+        model_key = ModelCache.key(arg['fight'])
+        arg['model_key'] = model_key
+        random_event_work = arg['fight']['random_event_work']
+        model = None
+        building = None
+        if not random_event_work:
+            while model_key in self.building:  # 同一模型正由其他请求建立
+                await asyncio.shield(self.building[model_key])
+            model = ModelCache.get(model_key)
+            if model is None:
+                building = self.building[model_key] = asyncio.get_running_loop().create_future()
+        try:
+            await job.send_message(category='model_cache', data=dict(ModelCache.stat(), hit=model is not None))
+            if model is None:
+                # await websocket.send('模型不存在, 或是开启了随机事件, 正在重新建立模型.')
+                # start_time = time.time()
+                await self.pool_calc.handle(job)
+                # end_time = time.time()
+                # run_time = int((end_time - start_time) * 1000)
+                # await self.send_message(category='time_spent', data=run_time)
+                model = ModelCache.get(model_key, count=False)
+        finally:
+            if building is not None:
+                self.building.pop(model_key)
+                building.set_result(None)
+        if model is not None:  # 如果还是不存在, 说明 worker_calc 运行出错, 此时不再运行 worker_attrbenefit
+            # start_time = time.time()
+            await self.pool_attrbenefit.handle(job)  # worker_attrbenefit 以内存映射的方式读取模型, 见 ModelCache.open
+            # end_time = time.time()
+            # run_time = int((end_time - start_time) * 1000)
+            # await self.send_message(category='time_spent', data=run_time)
+        if 'monte_carlo' in arg and random_event_work:  # 蒙特卡洛模式, 仅在开启随机事件时有意义
+            await self.process_montecarlo.handle(arg, job)
+
+        await job.send_message(category='data_end')
+
+
+liveness_interval = 1.0  # 等待子进程的消息时, 检查子进程是否存活的间隔 (秒)
+
+
+class QueueRelay():
+    '''
+        将子进程发送至 multiprocessing.Queue 的消息转发至 asyncio 事件循环.
+        转发线程 (守护线程) 阻塞地读取队列, 并通过 call_soon_threadsafe 唤醒事件循环. 因此消息到达后立即被处理, 而空闲时不占用 CPU.
+        子进程常驻, 队列也常驻, 因此每个队列只需要一个转发线程.
+    '''
+
+    def __init__(self, queue) -> None:
+        self.queue = queue
+        self.loop = asyncio.get_running_loop()
+        self.messages = asyncio.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                message = self.queue.get()
+                self.loop.call_soon_threadsafe(self.messages.put_nowait, message)
+            except (EOFError, OSError, RuntimeError):  # 队列被关闭, 或事件循环已关闭
+                break
+
+    async def get(self):
+        return await self.messages.get()
+
+    async def get_alive(self, process):
+        '''
+            读取消息. 仅在等待超过 liveness_interval 秒时检查 process 是否存活, 已退出时返回 None.
+            不使用 asyncio.wait_for, 因为它在消息到达的同时被取消时可能忽略取消.
+        '''
+        if not self.messages.empty():
+            return self.messages.get_nowait()
+        get = asyncio.ensure_future(self.messages.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait((get,), timeout=liveness_interval)
+                if done:
+                    return get.result()
+                if not process.is_alive():
+                    return None
+        finally:
+            if not get.done():
+                get.cancel()
+
+
+def child_calc_entry(queue_put, queue_get, ring_name):
+    '''子进程的入口函数. 不能放在子进程类中, 以避免子进程递归实例化子进程. 子进程常驻, 依次处理每次计算.'''
     import src.worker_calc.handle as child
-    child.handle(queue_put, queue_get)
+    child.serve(queue_put, queue_get, ring_name)
 
 
 class ProgramChildCalc():
-    '''用于计算的子进程.'''
+    '''用于计算的常驻子进程.'''
 
-    def __init__(self, parent) -> None:
-        self.parent: Program = parent
+    def __init__(self) -> None:
         self.queue_put = multiprocessing.Queue()
         self.queue_get = multiprocessing.Queue()
-        self.process_worker = multiprocessing.Process(target=child_calc_entry, args=(self.queue_put, self.queue_get))
+        self.relay = None  # 在第一次 handle 时 (即事件循环中) 创建, 见 QueueRelay
+        self.ring = DamageRing.create()  # 伤害数据的环形缓冲区, 子进程重新启动后继续使用
+        self.process_worker = multiprocessing.Process(target=child_calc_entry, args=(self.queue_put, self.queue_get, self.ring.name))
         self.process_worker.start()
 
     def cleanup(self):
         '''清理子进程.'''
         self.process_worker.terminate()
-
-    def reset(self):
-        '''重置子进程.'''
         self.process_worker.join()
-        self.process_worker = multiprocessing.Process(target=child_calc_entry, args=(self.queue_put, self.queue_get))
-        self.process_worker.start()
+        self.ring.close()
 
-    async def handle(self, arg):
-        '''子进程业务函数.'''
+    def reset(self):
+        '''
+            子进程常驻, 并在每次计算前自行重置模拟状态. 仅在子进程意外退出时重新启动.
+            重新启动时同时更换队列, 以免已退出的子进程未读取的请求或未读取完的消息被之后的计算读取.
+        '''
+        if not self.process_worker.is_alive():
+            self.process_worker.join()
+            self.queue_put = multiprocessing.Queue()
+            self.queue_get = multiprocessing.Queue()
+            self.relay = None
+            self.process_worker = multiprocessing.Process(target=child_calc_entry, args=(self.queue_put, self.queue_get, self.ring.name))
+            self.process_worker.start()
+
+    async def get_message(self):
+        '''读取子进程的消息. 子进程意外退出 (此时不会再发送结束消息) 时返回 None, 见 QueueRelay.get_alive.'''
+        return await self.relay.get_alive(self.process_worker)
+
+    async def handle(self, arg, job: Job):
+        '''子进程业务函数. 消息发送至发起请求的连接.'''
+        if self.relay is None:
+            self.relay = QueueRelay(self.queue_get)
+        self.ring.abort(False)
         self.queue_put.put(arg)
-        await self.parent.send_message(category='damage_begin')
+        try:
+            await self.receive(job)
+        except BaseException:  # 请求被取消或出错, 子进程的其余消息不会再被读取: 放弃本次计算并终止子进程, 由 reset 重新启动
+            self.ring.abort()
+            self.process_worker.terminate()
+            self.process_worker.join()
+            raise
+
+    async def receive(self, job: Job):
+        '''读取子进程本次计算的消息, 直至结束消息, 并发送至发起请求的连接.'''
+        await job.send_message(category='damage_begin')
         while True:
-            try:
-                message = self.queue_get.get_nowait()
-            except:
-                await asyncio.sleep(0.1)
-                continue
-            if type(message) == dict:
+            message = await self.get_message()
+            if message is None:  # 子进程意外退出
+                await job.send_message(category='damage_end')
+                await job.send_message(category='error')
+                break
+            if type(message) == tuple:  # 环形缓冲区的门铃消息
+                await job.send_damage_ring(self.ring, message)
+            elif type(message) == dict:
                 data = None
                 if 'data' in message:
                     data = message['data']
-                await self.parent.send_message(category=message['category'], data=data)
+                await job.send_message(category=message['category'], data=data)
             else:
-                await self.parent.send_message(category='damage_end')
+                await job.send_message(category='damage_end')
                 message: list
                 for i in message:
                     data = None
                     if 'data' in i:
                         data = i['data']
-                    await self.parent.send_message(category=i['category'], data=data)
+                    await job.send_message(category=i['category'], data=data)
                 break
 
 
-def child_attrbenefit_entry(index: int, pub_arg: dict):
-    '''子进程的入口函数. 不能放在子进程类中, 以避免子进程递归实例化子进程.'''
+def child_attrbenefit_entry(queue_put, queue_get, ring_name):
+    '''子进程的入口函数. 不能放在子进程类中, 以避免子进程递归实例化子进程. 子进程常驻, 依次处理每次计算.'''
     import src.worker_attrbenefit.handle as child
-    return child.handle(index, pub_arg)
-
-
-def child_fastcalc_entry(queue_put, queue_get):
-    '''子进程的入口函数. 不能放在子进程类中, 以避免子进程递归实例化子进程.'''
-    import src.worker_attrbenefit.handle as child
-    child.handle(0, None, queue_put, queue_get)
+    child.serve(queue_put, queue_get, ring_name)
 
 
 class ProgramChildAttrBenefit():
-    def __init__(self, parent) -> None:
-        self.parent: Program = parent
+    '''用于计算属性收益的常驻子进程. 各组属性在同一次模型回放中同时计算.'''
+
+    def __init__(self) -> None:
         self.queue_put = multiprocessing.Queue()
         self.queue_get = multiprocessing.Queue()
-        self.arg_list = ['元气收益', '攻击收益', '会心收益', '会效收益', '破防收益', '无双收益', '破招收益']
-        self.process_pool = multiprocessing.Pool(processes=len(self.arg_list), maxtasksperchild=1)
-        self.process_worker = multiprocessing.Process(target=child_fastcalc_entry, args=(self.queue_put, self.queue_get))
+        self.relay = None  # 在第一次 handle 时 (即事件循环中) 创建, 见 QueueRelay
+        self.ring = DamageRing.create()  # 伤害数据的环形缓冲区, 子进程重新启动后继续使用
+        self.process_worker = multiprocessing.Process(target=child_attrbenefit_entry, args=(self.queue_put, self.queue_get, self.ring.name))
         self.process_worker.start()
 
     def cleanup(self):
         '''清理子进程.'''
         self.process_worker.terminate()
-
-    def arg_init(self, arg):
-        ret = []
-        for i in range(len(self.arg_list)):
-            ret.append((i+1, arg))
-        return ret
-
-    def reset(self):
-        self.process_pool.close()
-        self.process_pool.join()
-        self.process_pool = multiprocessing.Pool(processes=len(self.arg_list), maxtasksperchild=1)
         self.process_worker.join()
-        self.process_worker = multiprocessing.Process(target=child_fastcalc_entry, args=(self.queue_put, self.queue_get))
-        self.process_worker.start()
+        self.ring.close()
 
-    async def handle(self, arg):
+    def reset(self):
+        '''
+            子进程常驻, 并在每次计算前自行重置模拟状态. 仅在子进程意外退出时重新启动.
+            重新启动时同时更换队列, 以免已退出的子进程未读取的请求或未读取完的消息被之后的计算读取.
+        '''
+        if not self.process_worker.is_alive():
+            self.process_worker.join()
+            self.queue_put = multiprocessing.Queue()
+            self.queue_get = multiprocessing.Queue()
+            self.relay = None
+            self.process_worker = multiprocessing.Process(target=child_attrbenefit_entry, args=(self.queue_put, self.queue_get, self.ring.name))
+            self.process_worker.start()
+
+    async def get_message(self):
+        '''读取子进程的消息. 子进程意外退出 (此时不会再发送结束消息) 时返回 None, 见 QueueRelay.get_alive.'''
+        return await self.relay.get_alive(self.process_worker)
+
+    async def handle(self, arg, job: Job):
+        '''子进程业务函数. 消息发送至发起请求的连接.'''
+        if self.relay is None:
+            self.relay = QueueRelay(self.queue_get)
+        self.ring.abort(False)
         self.queue_put.put(arg)
-        await self.parent.send_message(category='damage_begin')
-        arg_iterable = self.arg_init(arg)
-        results = self.process_pool.starmap_async(child_attrbenefit_entry, arg_iterable)
+        try:
+            await self.receive(job)
+        except BaseException:  # 请求被取消或出错, 子进程的其余消息不会再被读取: 放弃本次计算并终止子进程, 由 reset 重新启动
+            self.ring.abort()
+            self.process_worker.terminate()
+            self.process_worker.join()
+            raise
+
+    async def receive(self, job: Job):
+        '''读取子进程本次计算的消息, 直至结束消息, 并发送至发起请求的连接.'''
+        await job.send_message(category='damage_begin')
         while True:
-            try:
-                message = self.queue_get.get_nowait()
-            except:
-                await asyncio.sleep(0.05)
-                continue
-            if type(message) == dict:
+            message = await self.get_message()
+            if message is None:  # 子进程意外退出
+                await job.send_message(category='damage_end')
+                await job.send_message(category='error')
+                break
+            if type(message) == tuple:  # 环形缓冲区的门铃消息
+                await job.send_damage_ring(self.ring, message)
+            elif type(message) == dict:
                 data = None
                 if 'data' in message:
                     data = message['data']
-                await self.parent.send_message(category=message['category'], data=data)
+                await job.send_message(category=message['category'], data=data)
             else:
-                await self.parent.send_message(category='damage_end')
+                await job.send_message(category='damage_end')
                 message: list
                 for i in message:
                     data = None
                     if 'data' in i:
                         data = i['data']
-                    await self.parent.send_message(category=i['category'], data=data)
-                    if i['category'] == 'fight_stat' and data and 'dps' in data:
-                        dps = i['data']['dps']
+                    await job.send_message(category=i['category'], data=data)
                 break
-        while not results.ready():
-            await asyncio.sleep(0.05)
-        results = results.get()
-        attr_benefit = {}
-        for i in range(len(self.arg_list)):
-            attr_benefit[self.arg_list[i]] = (results[i] - dps) / (results[1] - dps)
-        await self.parent.send_message(category='attr_benefit', data=attr_benefit)
+
+
+def child_montecarlo_init(tokens):
+    '''进程池中子进程的初始化函数.'''
+    import src.worker_montecarlo.handle as child
+    child.load(tokens)
+
+
+def child_montecarlo_run(arg, seed, slot, token):
+    '''进程池中子进程的任务函数: 模拟一场战斗. 请求结束后 (令牌被清除) 放弃模拟并返回 None.'''
+    import src.worker_montecarlo.handle as child
+    return child.run(arg, seed, slot, token)
+
+
+class ProgramMonteCarlo():
+    '''
+        用于蒙特卡洛模式的常驻进程池, 进程数与 CPU 核心数相同. 进程池在第一次使用时创建.
+        请求中的 `monte_carlo` 字段 (均可省略):
+        - `runs` : 最多模拟的战斗场数, 默认为 100.
+        - `min_runs` : 提前停止前至少模拟的场数, 默认为 10.
+        - `tolerance` : dps 均值置信区间的半宽不大于该值时提前停止. 省略时总是模拟 runs 场.
+        - `confidence` : 置信水平, 默认为 0.95.
+        - `seed` : 随机数种子. 第 i 场战斗的种子为 seed + i. 省略时随机选取.
+        每完成一场战斗, 发送一次 category 为 'monte_carlo' 的消息, 内容见 src.worker_montecarlo.stat.MonteCarloStat.summary. 最后一次消息的 'finished' 为 True.
+
+        每个请求在共享内存 tokens 中占用一个位置 (slot) 并写入唯一的令牌, 提交的战斗带有 slot 与令牌. 请求结束 (提前停止, 出错或被取消) 时清除令牌,
+        仍在进程池中的战斗在开始前或模拟过程中发现令牌不匹配, 即放弃模拟, 因此不会延误之后的请求.
+    '''
+    slots = 64  # 同时进行的请求数的上限, 超出时等待
+
+    def __init__(self) -> None:
+        self.processes = os.cpu_count() or 1
+        self.pool = None
+        self.tokens = None
+        self.free = list(range(self.slots))
+        self.token = 0
+        self.condition = None
+
+    def cleanup(self):
+        '''清理进程池.'''
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+
+    async def handle(self, arg, job: Job):
+        from src.worker_montecarlo.stat import MonteCarloStat
+        option: dict = arg['monte_carlo'] if type(arg['monte_carlo']) == dict else {}
+        runs = max(1, int(option.get('runs', 100)))  # 至少模拟 1 场, 以保证发送 'finished' 为 True 的消息. 方差与置信区间在完成 2 场后才计算, 见 MonteCarloStat
+        seed = int(option.get('seed', random.randrange(2**31)))
+        tolerance = option.get('tolerance')
+        tolerance = float(tolerance) if tolerance not in (None, '') else None  # GUI 可能以字符串发送
+        stat = MonteCarloStat(float(option.get('confidence', 0.95)), tolerance, int(option.get('min_runs', 10)))
+        if self.pool is None:
+            self.tokens = multiprocessing.RawArray('q', self.slots)
+            self.pool = multiprocessing.Pool(self.processes, initializer=child_montecarlo_init, initargs=(self.tokens,))
+            self.condition = asyncio.Condition()
+        async with self.condition:
+            await self.condition.wait_for(lambda: len(self.free) > 0)
+            slot = self.free.pop()
+        self.token += 1
+        token = self.tokens[slot] = self.token
+        try:
+            await self.run(arg, job, stat, runs, seed, slot, token)
+        finally:
+            self.tokens[slot] = 0  # 放弃仍在进程池中的战斗
+            async with self.condition:
+                self.free.append(slot)
+                self.condition.notify()
+
+    async def run(self, arg, job: Job, stat, runs: int, seed: int, slot: int, token: int):
+        loop = asyncio.get_running_loop()
+        done = asyncio.Queue()
+
+        def submit(i):
+            self.pool.apply_async(
+                child_montecarlo_run, (arg, seed + i, slot, token),
+                callback=lambda res: loop.call_soon_threadsafe(done.put_nowait, res),
+                error_callback=lambda e: loop.call_soon_threadsafe(done.put_nowait, e),
+            )
+
+        # 进程池中最多同时有 processes 场战斗, 每完成一场再提交下一场, 以便提前停止
+        submitted = min(runs, self.processes)
+        for i in range(submitted):
+            submit(i)
+        running = submitted
+        while running > 0:
+            res = await done.get()
+            running -= 1
+            if isinstance(res, BaseException):
+                print(f'Monte carlo run failed: {res!r}')
+                await job.send_message(category='error')
+                break
+            stat.add(res['dps'])
+            stopped = stat.count >= runs or stat.converged
+            data = stat.summary()
+            data['seed'] = seed
+            data['finished'] = stopped
+            await job.send_message(category='monte_carlo', data=data)
+            if not stopped and submitted < runs:
+                submit(submitted)
+                submitted += 1
+                running += 1
+            if stopped:
+                break  # 仍在运行的战斗由 handle 清除令牌后放弃
+
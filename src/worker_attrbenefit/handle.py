@@ -1,42 +1,78 @@
 # -*- coding: utf-8 -*-
 from src.frame.damage import Damage
+from src.frame.damagering import DamageRing
+from src.frame.damagestream import DamageStream
+from src.frame.event import Event
 from src.worker_attrbenefit.subattr import SubAttr
 import src.worker_attrbenefit.method as method
 import src.worker_attrbenefit.init as init
+import traceback
 
 
-def handle(index: int, pub_arg: dict, queue_get=None, queue_put=None):
-    selfattr = SubAttr()
-    targetattr = SubAttr()
-    init.init(selfattr)
-    if queue_put is not None:
-        Damage.connect_queue = queue_put
-    if queue_get is not None:
-        pub_arg = queue_get.get()
-    selfattr.load_from_json(pub_arg['attr_self']['attr'])
-    targetattr.load_from_json(pub_arg['attr_target']['attr'])
-    selfattr.load_env(pub_arg['env'])
-    selfattr.load_attr_benefit(index)
-    targetattr.DamageSource = selfattr
-    method.fight(pub_arg['fight'], selfattr, targetattr)
-    # if 0 == index:
-    #     fight_analysis = dict(sorted(Damage.damage_statistics().items(), key=lambda x: x[1]['proportion'], reverse=True))
-    #     with open('tempres.json', 'w', encoding='utf-8') as f:
-    #         json.dump(fight_analysis, f, ensure_ascii=False, indent=4)
-    #     # print(f"\n战斗时长: {'{:.2f}'.format(Damage.damage_list[-1]['tick'] / 1024)} 秒. 已将战斗统计保存至 tempres.json 文件.")
-    if queue_put is not None:
+def serve(queue_get, queue_put, ring_name: str = None):
+    '''常驻 worker 的主循环. 每次计算前重置模拟状态. 伤害数据通过共享内存中的环形缓冲区 (ring_name) 发送.'''
+    ring = DamageRing.attach(ring_name) if ring_name is not None else None
+    while True:
+        handle(queue_get, queue_put, ring)
+
+
+def handle(queue_get, queue_put, ring: DamageRing = None):
+    '''
+        回放模型并计算属性收益. 各组属性 (见 SubAttr.load_attr_benefit) 在同一次回放中同时计算, 而非每组属性各回放一次.
+        无论是否出错, 最后总会发送一条列表消息 (结束消息), 服务进程以此判断本次计算结束.
+    '''
+    pub_arg = queue_get.get()
+    message_send = [{
+        'category': 'error',
+    }]
+    Damage.stream = None
+    model = None
+    try:
+        Event.reset()
+        Damage.reset()
+        selfattr = SubAttr()
+        targetattr = SubAttr()
+        init.init(selfattr)
+        selfattr.load_from_json(pub_arg['attr_self']['attr'])
+        targetattr.load_from_json(pub_arg['attr_target']['attr'])
+        selfattr.load_env(pub_arg['env'])
+        name_list = selfattr.load_attr_benefit(pub_arg.get('attr_benefit'))
+        targetattr.DamageSource = selfattr
+        model = method.load_model(pub_arg)
+        Damage.stream = DamageStream(queue_put, pub_arg.get('stream'), model.duration if len(model) > 0 else None, ring)
+        method.fight(model, selfattr, targetattr)
+        Damage.stream.close()
+        Damage.stream = None
         fight_stat = {
             'fight_duration': Damage.damage_list[-1]['tick'] / 1024,
             'dps': Damage.dps,
         }
         fight_analysis = dict(sorted(Damage.damage_statistics().items(), key=lambda x: x[1]['proportion'], reverse=True))
-        # queue_put.put(fight_stat)
-        # queue_put.put(fight_analysis)
-        queue_put.put([{
+        # 以攻击收益为基准 (为 1), 若未计算攻击收益则以第一组属性为基准
+        variant_dps = Damage.variant_dps
+        base = name_list.index('攻击收益') + 1 if '攻击收益' in name_list else 1
+        attr_benefit = {}
+        for i, name in enumerate(name_list):
+            denominator = variant_dps[base] - variant_dps[0]
+            attr_benefit[name] = float((variant_dps[i + 1] - variant_dps[0]) / denominator) if 0 != denominator else 0.0
+        message_send = [{
             'category': 'fight_stat',
             'data': fight_stat,
         }, {
             'category': 'fight_analysis',
             'data': fight_analysis,
-        }])
-    return Damage.dps
+        }, {
+            'category': 'attr_benefit',
+            'data': attr_benefit,
+        }]
+    except Exception:
+        traceback.print_exc()
+    finally:
+        if model is not None:
+            model.close()
+        if Damage.stream is not None:
+            try:
+                Damage.stream.close()
+            except Exception:
+                traceback.print_exc()
+        queue_put.put(message_send)
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from src.frame.attribute import trunc
 from src.worker_attrbenefit.subattr import SubAttr
 
 '''
@@ -10,13 +11,13 @@ from src.worker_attrbenefit.subattr import SubAttr
 def init_焚影圣诀(obj: SubAttr):
     # 额外攻击力转换
     def calc_attack_power_add(self):
-        return int(self.atSpunkBase * 1946 / 1024)  # 1 点元气转换为 1946 / 1024 点攻击力
+        return trunc(self.atSpunkBase * 1946 / 1024)  # 1 点元气转换为 1946 / 1024 点攻击力
     obj.kungfuSolarAttackPowerAdd = calc_attack_power_add
     obj.kungfuLunarAttackPowerAdd = calc_attack_power_add
 
     # 额外会心转换
     def calc_critical_strike_add(self):
-        return int(self.atSpunkBase * 297 / 1024)  # 1 点元气转换为 297 / 1024 点会心等级
+        return trunc(self.atSpunkBase * 297 / 1024)  # 1 点元气转换为 297 / 1024 点会心等级
     obj.kungfuSolarCriticalStrikeAdd = calc_critical_strike_add
     obj.kungfuLunarCriticalStrikeAdd = calc_critical_strike_add
 
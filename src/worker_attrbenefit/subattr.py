@@ -1,31 +1,54 @@
 # -*- coding: utf-8 -*-
 from src.frame.attribute import Attribute
 import json
+import numpy
+
+
+attr_benefit_default = {
+    '元气收益': {'atSpunkBase': 179},
+    '攻击收益': {
+        'atPhysicsAttackPowerBase': 360,
+        'atSolarAttackPowerBase': 430,
+        'atLunarAttackPowerBase': 430,
+        'atNeutralAttackPowerBase': 430,
+        'atPoisonAttackPowerBase': 430,
+    },
+    '会心收益': {'atAllTypeCriticalStrike': 799},
+    '会效收益': {'atAllTypeCriticalDamagePowerBase': 799},
+    '破防收益': {
+        'atPhysicsOvercomeBase': 799,
+        'atMagicOvercome': 799,
+    },
+    '无双收益': {'atStrainBase': 799},
+    '破招收益': {'atSurplusValueBase': 799},
+}
 
 
 class SubAttr(Attribute):
     def __init__(self) -> None:
         super().__init__()
 
-    def load_attr_benefit(self, index):
+    def load_attr_benefit(self, table: dict = None) -> list:
+        '''
+            将属性变为以各组属性为元素的 numpy 数组, 以便在一次回放中同时计算所有属性收益.
+            - `table` : 各组属性相对原始属性的增量, 形如 {'攻击收益': {'atPhysicsAttackPowerBase': 360, ...}, ...}. 省略时使用 attr_benefit_default.
+
+            数组下标 0 为原始属性, 下标 i 为 table 中的第 i 组属性. 返回值为各组属性的名称 (按下标顺序, 不含原始属性).
+            注意, 只能操作 base_list 中的属性, 原因同 load_env.
+        '''
+        if table is None:
+            table = attr_benefit_default
+        name_list = list(table)
+        delta = {}
+        for i, name in enumerate(name_list):
+            for key, value in table[name].items():
+                if key not in self.base_set:
+                    raise RuntimeError(f'Attribute {key} can not be used for attribute benefit.')
+                if key not in delta:
+                    delta[key] = numpy.zeros(len(name_list) + 1, dtype='int64')
+                delta[key][i + 1] += int(value)
         self.bool_record = True
-        if 2 == index:
-            self.atPhysicsAttackPowerBase += 360
-            self.atSolarAttackPowerBase += 430
-            self.atLunarAttackPowerBase += 430
-            self.atNeutralAttackPowerBase += 430
-            self.atPoisonAttackPowerBase += 430
-        elif 1 == index:
-            self.atSpunkBase += 179
-        elif 3 == index:
-            self.atAllTypeCriticalStrike += 799
-        elif 4 == index:
-            self.atAllTypeCriticalDamagePowerBase += 799
-        elif 5 == index:
-            self.atPhysicsOvercomeBase += 799
-            self.atMagicOvercome += 799
-        elif 6 == index:
-            self.atStrainBase += 799
-        elif 7 == index:
-            self.atSurplusValueBase += 799
+        for key, value in delta.items():
+            setattr(self, key, getattr(self, key) + value)
         self.bool_record = False
+        return name_list
@@ -3,32 +3,54 @@ import src.worker_calc.init as init
 import src.worker_calc.method as method
 from src.character.player import player
 from src.character.target import target
+from src.frame.checkpoint import Checkpoint
 from src.frame.damage import Damage
+from src.frame.damagering import DamageRing
+from src.frame.damagestream import DamageStream
 import traceback
 
 
-def handle(queue_get, queue_put):
+def serve(queue_get, queue_put, ring_name: str = None):
+    '''常驻 worker 的主循环. 表与脚本只加载一次, 每次计算前重置模拟状态. 伤害数据通过共享内存中的环形缓冲区 (ring_name) 发送.'''
+    ring = DamageRing.attach(ring_name) if ring_name is not None else None
+    init.load()
+    while True:
+        handle(queue_get, queue_put, ring)
 
-    init.init()
 
+def handle(queue_get, queue_put, ring: DamageRing = None):
+    '''处理一次计算. 无论是否出错, 最后总会发送一条列表消息 (结束消息), 服务进程以此判断本次计算结束.'''
     message_recv: dict = queue_get.get()
-    player.load_character(message_recv['attr_self'])
-    target.load_character(message_recv['attr_target'])
-    player.attr.load_env(message_recv['env'])
-    Damage.connect_queue = queue_put
+    message_send = [{
+        'category': 'error',
+    }]
+    Damage.stream = None
     try:
-        method.fight(message_recv['fight'])
+        init.reset()
+        init.init()
+        player.load_character(message_recv['attr_self'])
+        target.load_character(message_recv['attr_target'])
+        player.attr.load_env(message_recv['env'])
+        Damage.stream = DamageStream(queue_put, message_recv.get('stream'), ring=ring)
+        # 开启随机事件时每次重新模拟, 不使用检查点 (与模型缓存一致)
+        checkpoint_key = Checkpoint.base_key(message_recv) if not message_recv['fight']['random_event_work'] else None
+        method.fight(message_recv['fight'], message_recv.get('model_key'), checkpoint_key)
         message_send = [{
             'category': 'fight_stat',
             'data': {
                 'fight_duration': Damage.damage_list[-1]['tick'] / 1024,
                 'dps': Damage.dps,
             }
+        }, {
+            'category': 'checkpoint',
+            'data': Checkpoint.stat(),
         }]
-        queue_put.put(message_send)
-    except Exception as e:
+    except Exception:
         traceback.print_exc()
-        message_send = [{
-            'category': 'error',
-        }]
+    finally:
+        if Damage.stream is not None:
+            try:
+                Damage.stream.close()
+            except Exception:
+                traceback.print_exc()
         queue_put.put(message_send)
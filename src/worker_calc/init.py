@@ -2,6 +2,29 @@
 import json
 from src.character.player import player
 from src.character.target import target
+from src.frame.context import SimulationContext
+from src.frame.damage import Damage
+from src.frame.event import Event
+from src.frame.script import Script
+from src.frame.skills import Skill
+
+
+def load():
+    '''worker 启动时调用一次. 表在模块导入时已加载, 此处读取脚本清单 (脚本模块在第一次被调用时导入).'''
+    Script.load()
+
+
+def reset():
+    '''
+        重置当前上下文 (见 src.frame.context.SimulationContext) 的模拟状态, 在每次计算前调用. 表, 脚本与编译结果 (如 BuffEffect, 脚本调度表) 在进程内保留.
+        注意, target 需要先于 player 重置, 因为 player 在初始化时会设置 target 的伤害来源.
+    '''
+    Event.reset()
+    Damage.reset()
+    Skill.reset()
+    target.reset()
+    player.reset()
+    SimulationContext.current().script_state = {}
 
 
 def init():
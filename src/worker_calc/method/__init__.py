@@ -3,10 +3,9 @@ from src.character.player import player
 from src.character.target import target
 from src.frame.damage import Damage
 from src.frame.fetchdata import TabAttr
+from src.frame.modelcache import ModelCache
 import src.worker_calc.method.macro as macro
-import hashlib
 import json
-import pickle
 
 
 def custom_fight(data: dict):
@@ -26,15 +25,24 @@ def custom_fight(data: dict):
         player.random_event.apply()
 
 
-def fight(data: dict):
+def simulate(data: dict, checkpoint_key: str = None, cancelled=None) -> bool:
+    '''
+        模拟一场战斗. 不保存模型, 见 fight. 模拟被放弃时返回 False.
+        - `checkpoint_key` : 检查点的基础键, 见 src.frame.checkpoint.Checkpoint.base_key. 为 None 时不使用检查点.
+        - `cancelled` : 无参函数, 返回 True 时放弃模拟, 见 src.worker_calc.method.macro.MacroList.calc.
+    '''
     custom_fight(data)
     with open('data/player.json', 'r', encoding='utf-8') as f:
         playerdata = json.load(f)
         kungfu_name = playerdata['KungFuSkill']['name']
     c = getattr(macro, f'MacroList_{kungfu_name}')
-    macro_list = c(data)
-    macro_list.calc()
+    macro_list = c(data, checkpoint_key)
+    return macro_list.calc(cancelled)
+
+
+def fight(data: dict, model_key: str = None, checkpoint_key: str = None):
+    simulate(data, checkpoint_key)
     TabAttr.save_data()
-    cachename = hashlib.md5(json.dumps(data).encode('utf-8')).hexdigest()
-    with open(f'data/cache/{cachename}', 'wb') as f:
-        pickle.dump(Damage.export_model(), f)
+    if model_key is None:
+        model_key = ModelCache.key(data)
+    ModelCache.put(model_key, Damage.export_model())
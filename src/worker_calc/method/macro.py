@@ -1,27 +1,83 @@
 # -*- coding: utf-8 -*-
 import json
 from src.character.player import player
+from src.frame.checkpoint import Checkpoint
+from src.frame.context import SimulationContext
 from src.frame.event import Event
 from src.frame.damage import Damage
 
 
 class MacroList():
-    def __init__(self, data: dict) -> None:
+    '''
+        宏. 子类在 start 中设定起手状态并开始施展技能, 之后由 calc 处理事件直至技能列表执行完毕.
+        给定检查点的基础键 (见 src.frame.checkpoint.Checkpoint.base_key) 时, 在每个 lists 块的边界处保存检查点, 并从最长的相同前缀对应的检查点继续模拟.
+    '''
+    cancel_interval = 10 * 1024  # calc 检查是否放弃模拟的间隔 (tick)
+
+    def __init__(self, data: dict, checkpoint_key: str = None) -> None:
         # with open('data/fight.json', 'r', encoding='utf-8') as f:
         #     data = json.load(f)
         self.normal_skill: dict = data['include']['normal_skill']
         self.special_skill: dict = data['include']['special_skill']
         self.ping: int = data['ping']
         self.skill_list = []
+        self.boundary = []  # 各 lists 块的结束位置
         for l in data['skill_list']:
             self.skill_list.extend(data['include']['lists'][l])
+            self.boundary.append(len(self.skill_list))
         self.index = 0
+        self.read = 0  # 已读取的技能数. 模拟状态只取决于 skill_list[:read]
         self.normal_CD = 0
+        self.prefix_key = Checkpoint.prefix_keys(checkpoint_key, self.skill_list) if checkpoint_key is not None else None
+
+    def start(self):
+        '''设定起手状态并开始施展技能.'''
+        raise NotImplementedError
+
+    def calc(self, cancelled=None) -> bool:
+        '''
+            处理事件直至技能列表执行完毕, 返回 True.
+            - `cancelled` : 无参函数. 模拟过程中每隔 cancel_interval 检查一次, 返回 True 时放弃模拟并返回 False.
+        '''
+        if not self.resume():
+            self.start()
+        boundary = [i for i in self.boundary if i > self.index]
+        check = 0 if cancelled is not None else float('inf')  # 下一次检查是否放弃模拟的时间
+        while Event.count > 0 and self.index < len(self.skill_list):
+            Event.handle()
+            if len(boundary) > 0 and self.index >= boundary[0]:
+                while len(boundary) > 0 and self.index >= boundary[0]:
+                    boundary.pop(0)
+                self.save_checkpoint()
+            if Event.tick >= check:
+                if cancelled():
+                    return False
+                check = Event.tick + self.cancel_interval
+        return True
+
+    def save_checkpoint(self):
+        if self.prefix_key is not None:
+            Checkpoint.put(self.prefix_key[self.read], (SimulationContext.snapshot(self), self.index, self.read))
+
+    def resume(self) -> bool:
+        '''从最长的相同前缀对应的检查点恢复状态. 恢复前已发送的伤害数据会重新发送.'''
+        if self.prefix_key is None:
+            return False
+        ret = Checkpoint.find(self.prefix_key)
+        if ret is None:
+            return False
+        snapshot, self.index, self.read = ret[1]
+        SimulationContext.restore(snapshot, self)
+        if Damage.stream is not None:
+            for tick, except_damage in zip(Damage.damage_list.tick, Damage.damage_list.except_damage):
+                Damage.stream.push(tick, except_damage)
+        return True
 
     def handle_skill(self):
         if self.normal_CD == 0:
             raise RuntimeError('Need to set normal CD before handle skill.')
         name = self.skill_list[self.index]
+        self.read = max(self.read, self.index + 1)
         if name in self.normal_skill:  # 常规技能 (占用 GCD)
             SkillID = self.normal_skill[name]
             # 检查 CD
@@ -60,21 +116,17 @@ class MacroList():
 
 
 class MacroList_焚影圣诀(MacroList):
-    def __init__(self, data: dict) -> None:
-        super().__init__(data)
+    def __init__(self, data: dict, checkpoint_key: str = None) -> None:
+        super().__init__(data, checkpoint_key)
         self.normal_CD = 503
+        player.cooldown.over = self.cooldown_over  # 以绑定方法 (而非闭包) 替换, 以便检查点能够将其指向恢复后的宏
 
-        ping = self.ping
-        handle_skill = self.handle_skill
-
-        def cooldown_over(self, ID):
-            self.table.pop(ID)
-            if 503 == ID:
-                Event.add(int(ping/1000*1024), handle_skill)
-            if 8 == ID:
-                player.cast_skill(4326)
-
-        player.cooldown.over = cooldown_over.__get__(player.cooldown)
+    def cooldown_over(self, ID):
+        player.cooldown.table.pop(ID)
+        if 503 == ID:
+            Event.add(int(self.ping/1000*1024), self.handle_skill)
+        if 8 == ID:
+            player.cast_skill(4326)
 
     def handle_开特效腰坠(self):
         if player.skills.is_exist(6800):
@@ -89,7 +141,7 @@ class MacroList_焚影圣诀(MacroList):
     def handle_点掉日月灵魂(self):
         player.buff.delete(25765, all=True)
 
-    def calc(self):
+    def start(self):
         # 起手状态设定
         player.attr.atCurrentSunEnergy = 10000
         player.attr.atCurrentMoonEnergy = 10000
@@ -98,5 +150,3 @@ class MacroList_焚影圣诀(MacroList):
         # 进入战斗
         self.handle_skill()  # 开技能
         player.cast_skill(4326)  # 开大漠刀法
-        while len(Event.tick_list) > 0 and self.index < len(self.skill_list):
-            Event.handle()
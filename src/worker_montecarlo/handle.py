@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from typing import Union
+import src.worker_calc.init as init
+import src.worker_calc.method as method
+from src.character.player import player
+from src.character.target import target
+from src.frame.context import SimulationContext
+from src.frame.damage import Damage
+from src.frame.event import Event
+
+tokens = None  # 各请求的令牌 (共享内存), 见 src.main.ProgramMonteCarlo
+
+
+def load(shared_tokens=None):
+    '''进程池中的 worker 启动时调用一次.'''
+    global tokens
+    tokens = shared_tokens
+    init.load()
+
+
+def run(arg: dict, seed: int, slot: int = None, token: int = None) -> Union[dict, None]:
+    '''
+        以给定的随机数种子在新的上下文 (见 src.frame.context.SimulationContext) 中模拟一场战斗, 返回其 dps. 同一 seed 的结果是确定的.
+        与 src.worker_calc 不同, 本函数不保存模型, 也不发送伤害数据.
+        给定 slot 与 token 时, 若共享内存中该位置的令牌不再是 token (请求已结束), 则放弃本场战斗并返回 None.
+    '''
+    cancelled = None
+    if slot is not None and tokens is not None:
+        def cancelled():
+            return tokens[slot] != token
+        if cancelled():
+            return None
+    with SimulationContext(seed):
+        init.init()
+        player.load_character(arg['attr_self'])
+        target.load_character(arg['attr_target'])
+        player.attr.load_env(arg['env'])
+        if not method.simulate(arg['fight'], cancelled=cancelled):
+            return None
+        return {
+            'seed': seed,
+            'fight_duration': Event.tick / 1024,
+            'dps': float(Damage.dps),
+        }
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from statistics import NormalDist
+import math
+
+
+class MonteCarloStat():
+    '''
+        MonteCarloStat 类用于汇总多场战斗的 dps, 计算均值, 标准差, 百分位数与均值的置信区间.
+        - `confidence` : 置信水平, 如 0.95.
+        - `tolerance` : 置信区间的半宽 (以 dps 计). 半宽不大于该值且已完成至少 min_runs 场战斗时, 认为结果已足够可信, 见 converged.
+    '''
+    percentile_list = (5, 25, 50, 75, 95)
+
+    def __init__(self, confidence=0.95, tolerance=None, min_runs=10) -> None:
+        self.confidence = confidence
+        self.tolerance = tolerance
+        self.min_runs = min_runs
+        self.z = NormalDist().inv_cdf((1 + confidence) / 2)
+        self.dps_list = []
+        # Welford 算法, 增量计算均值与方差
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, dps: float):
+        self.dps_list.append(dps)
+        delta = dps - self.mean
+        self.mean += delta / len(self.dps_list)
+        self.m2 += delta * (dps - self.mean)
+
+    @property
+    def count(self):
+        return len(self.dps_list)
+
+    @property
+    def std(self):
+        '''样本标准差.'''
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    @property
+    def half_width(self):
+        '''均值置信区间的半宽. 少于 2 场战斗时为 None.'''
+        return self.z * self.std / math.sqrt(self.count) if self.count > 1 else None
+
+    @property
+    def converged(self):
+        if self.tolerance is None or self.count < max(2, self.min_runs):
+            return False
+        return self.half_width <= self.tolerance
+
+    def percentile(self, sorted_list: list, p) -> float:
+        '''线性插值的百分位数.'''
+        position = (len(sorted_list) - 1) * p / 100
+        low = math.floor(position)
+        high = min(low + 1, len(sorted_list) - 1)
+        return sorted_list[low] + (sorted_list[high] - sorted_list[low]) * (position - low)
+
+    def summary(self) -> dict:
+        if self.count == 0:
+            return {'count': 0}
+        sorted_list = sorted(self.dps_list)
+        half_width = self.half_width
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'std': self.std,
+            'min': sorted_list[0],
+            'max': sorted_list[-1],
+            'percentile': {f'p{p}': self.percentile(sorted_list, p) for p in self.percentile_list},
+            'confidence': self.confidence,
+            'half_width': half_width,
+            'ci': [self.mean - half_width, self.mean + half_width] if half_width is not None else None,
+        }
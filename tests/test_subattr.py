@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from src.worker_attrbenefit.subattr import SubAttr
+import numpy
+import unittest
+
+
+class TestSubAttr(unittest.TestCase):
+    def test_calc_does_not_modify_array_attr(self):
+        '''读取最终属性不应修改以 numpy 数组表示的基础属性.'''
+        attr = SubAttr()
+        attr.atSolarAttackPowerBase = 1000
+        attr.atMagicAttackPowerBase = 50
+        attr.atAllTypeCriticalDamagePowerBase = 100
+        attr.atMagicCriticalDamagePowerBase = 20
+        attr.load_attr_benefit()
+        attack_base = attr.atSolarAttackPowerBase.copy()
+        critical_base = attr.atAllTypeCriticalDamagePowerBase.copy()
+        first = attr.calcSolarAttackPower
+        attr.atMagicAttackPowerBase = 60  # 修改后再次读取
+        second = attr.calcSolarAttackPower
+        attr.calcSolarCriticalDamagePower
+        attr.atMagicCriticalDamagePowerBase = 30
+        attr.calcSolarCriticalDamagePower
+        numpy.testing.assert_array_equal(attr.atSolarAttackPowerBase, attack_base)
+        numpy.testing.assert_array_equal(attr.atAllTypeCriticalDamagePowerBase, critical_base)
+        numpy.testing.assert_array_equal(second - first, numpy.full(len(first), 10))
+
+
+if __name__ == '__main__':
+    unittest.main()